@@ -11,6 +11,8 @@ class AddAnimeDialog(QDialog):
         self.db = db
         self.anime_id = anime_id
         self.poster_image = None
+        # Выбранный файл постера: в базу он записывается порциями прямо из файла
+        self.poster_path = None
 
         ui_path = os.path.join(os.path.dirname(__file__), '..', 'qt', 'add_anime_dialog.ui')
         uic.loadUi(ui_path, self)
@@ -119,24 +121,28 @@ class AddAnimeDialog(QDialog):
         )
 
         if file_path:
-            try:
-                with open(file_path, 'rb') as f:
-                    self.poster_image = f.read()
-                self.update_poster_preview()
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить изображение: {e}")
+            # Превью Qt читает из файла сам, байты постера в памяти не держим
+            pixmap = QPixmap(file_path)
+            if pixmap.isNull():
+                QMessageBox.critical(self, "Ошибка", "Не удалось загрузить изображение")
+                return
+            self.poster_path = file_path
+            self.poster_image = None
+            self.update_poster_preview(pixmap)
 
     def clear_poster(self):
         """Очищает постер"""
         self.poster_image = None
+        self.poster_path = None
         self.lbl_poster_preview.clear()
         self.lbl_poster_preview.setText("Постер не загружен")
 
-    def update_poster_preview(self):
-        """Обновляет превью постера"""
-        if self.poster_image:
+    def update_poster_preview(self, pixmap=None):
+        """Обновляет превью постера (pixmap - уже загруженное изображение)"""
+        if pixmap is None and self.poster_image:
             pixmap = QPixmap()
             pixmap.loadFromData(self.poster_image)
+        if pixmap is not None:
             scaled_pixmap = pixmap.scaled(180, 250, Qt.AspectRatioMode.KeepAspectRatio)
             self.lbl_poster_preview.setPixmap(scaled_pixmap)
 
@@ -173,10 +179,25 @@ class AddAnimeDialog(QDialog):
             'finish_date': self.date_finish.date().toString("yyyy-MM-dd"),
             'review': self.text_review.toPlainText().strip(),
             'poster_image': self.poster_image,
+            'poster_path': self.poster_path,
             'total_episodes': self.spin_total_episodes.value(),
             'watched_episodes': self.spin_watched_episodes.value()
         }
 
+        # Предупреждаем, если такое аниме уже есть в коллекции
+        duplicate_id = self.db.find_duplicate(anime_data['title'], exclude_id=self.anime_id)
+        if duplicate_id:
+            duplicate = self.db.get_anime_summary(duplicate_id)
+            reply = QMessageBox.question(
+                self, "Возможный дубликат",
+                f"В коллекции уже есть '{duplicate['title']}' ({duplicate['status']}).\n"
+                f"Все равно сохранить?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+                QMessageBox.StandardButton.No
+            )
+            if reply != QMessageBox.StandardButton.Yes:
+                return
+
         # Определяем рейтинг
         anime_data['rating'] = None
         for rating, button in self.rating_buttons.items():
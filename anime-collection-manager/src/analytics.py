@@ -0,0 +1,246 @@
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+
+from database import ANIME_STATUSES, ANIME_TYPES
+
+# Средняя длительность эпизода для оценки времени просмотра (минуты)
+EPISODE_MINUTES = 24
+
+# Оценки в базе - целые числа от 1 до RATING_MAX
+RATING_MAX = 10
+
+# Сколько пропущенных записей дочитывается одним запросом (лимит параметров SQLite)
+MISSING_CHUNK = 500
+
+SNAPSHOT_COLUMNS = '''
+    id, rating, total_episodes, watched_episodes, status, type, genre_id, finish_date, updated_at
+'''
+
+
+class CollectionSnapshot:
+    """Колоночный снимок коллекции в массивах NumPy для быстрой аналитики (только чтение).
+
+    Снимок строится один раз, а refresh() дочитывает только записи, измененные
+    после прошлого обновления (по updated_at), и убирает удаленные (по разнице ID).
+    Все массивы выровнены по ids (по возрастанию). Пропуски: оценка - NaN,
+    коды статуса/типа/жанра - -1, дата окончания - NaT.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._token = None
+        # Наибольший updated_at среди прочитанных записей
+        self._synced_at = None
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.rating = np.empty(0, dtype=np.float64)
+        self.total_episodes = np.empty(0, dtype=np.int32)
+        self.watched_episodes = np.empty(0, dtype=np.int32)
+        self.status = np.empty(0, dtype=np.int8)
+        self.type = np.empty(0, dtype=np.int8)
+        self.genre_id = np.empty(0, dtype=np.int32)
+        self.finish_date = np.empty(0, dtype='datetime64[D]')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def refresh(self) -> bool:
+        """Приводит снимок к текущему состоянию базы; возвращает True, если он изменился"""
+        token = self.db.change_token()
+        if token == self._token:
+            return False
+
+        cursor = self.db.connect().cursor()
+        if self._synced_at is None:
+            cursor.execute(f"SELECT {SNAPSHOT_COLUMNS} FROM anime ORDER BY id")
+        else:
+            # Записи, измененные в ту же секунду, что и прошлое обновление, читаются повторно
+            cursor.execute(f"SELECT {SNAPSHOT_COLUMNS} FROM anime WHERE updated_at >= ? ORDER BY id",
+                           (self._synced_at,))
+        self._apply(cursor.fetchall())
+
+        # Количество в базе не сходится со снимком: есть удаленные записи или записи,
+        # зафиксированные с updated_at раньше прошлого обновления (долгая транзакция,
+        # другой процесс с иными часами) - сверяем снимок со списком ID
+        if len(self.ids) != self.db.count_anime():
+            cursor.execute("SELECT id FROM anime")
+            alive = np.fromiter((row[0] for row in cursor), dtype=np.int64)
+            self._take(np.isin(self.ids, alive))
+
+            missing = np.setdiff1d(alive, self.ids, assume_unique=True)
+            for start in range(0, len(missing), MISSING_CHUNK):
+                chunk = missing[start:start + MISSING_CHUNK].tolist()
+                placeholders = ", ".join("?" * len(chunk))
+                cursor.execute(f"SELECT {SNAPSHOT_COLUMNS} FROM anime WHERE id IN ({placeholders}) ORDER BY id",
+                               chunk)
+                self._apply(cursor.fetchall())
+
+        self._token = token
+        return True
+
+    def _apply(self, rows):
+        """Добавляет новые записи и обновляет уже известные"""
+        if not rows:
+            return
+
+        ids, rating, total, watched, status, anime_type, genre_id, finish_date, updated_at = zip(*rows)
+        status_codes = {name: code for code, name in enumerate(ANIME_STATUSES)}
+        type_codes = {name: code for code, name in enumerate(ANIME_TYPES)}
+
+        columns = {
+            'ids': np.array(ids, dtype=np.int64),
+            'rating': np.array([np.nan if value is None else value for value in rating], dtype=np.float64),
+            'total_episodes': np.array([value or 0 for value in total], dtype=np.int32),
+            'watched_episodes': np.array([value or 0 for value in watched], dtype=np.int32),
+            'status': np.array([status_codes.get(value, -1) for value in status], dtype=np.int8),
+            'type': np.array([type_codes.get(value, -1) for value in anime_type], dtype=np.int8),
+            'genre_id': np.array([-1 if value is None else value for value in genre_id], dtype=np.int32),
+            'finish_date': self._parse_dates(finish_date),
+        }
+        synced_at = max(value for value in updated_at if value is not None) if any(updated_at) else None
+        if synced_at and (self._synced_at is None or synced_at > self._synced_at):
+            self._synced_at = synced_at
+
+        # Известные записи обновляются на месте, новые дописываются в конец
+        positions = np.searchsorted(self.ids, columns['ids'])
+        known = positions < len(self.ids)
+        known[known] = self.ids[positions[known]] == columns['ids'][known]
+        for name, values in columns.items():
+            array = getattr(self, name)
+            array[positions[known]] = values[known]
+            setattr(self, name, np.concatenate([array, values[~known]]))
+
+        # Новые ID обычно больше всех известных, но порядок по ID нужен для searchsorted
+        if len(self.ids) > 1 and np.any(self.ids[1:] < self.ids[:-1]):
+            self._take(np.argsort(self.ids, kind='stable'))
+
+    def _take(self, index):
+        """Оставляет (или переставляет) строки снимка по маске или индексам"""
+        for name in ('ids', 'rating', 'total_episodes', 'watched_episodes',
+                     'status', 'type', 'genre_id', 'finish_date'):
+            setattr(self, name, getattr(self, name)[index])
+
+    @staticmethod
+    def _parse_dates(values: Sequence[Optional[str]]) -> np.ndarray:
+        """Преобразует даты ГГГГ-ММ-ДД в datetime64[D], пустые и ошибочные - в NaT"""
+        try:
+            return np.array([value or 'NaT' for value in values], dtype='datetime64[D]')
+        except ValueError:
+            dates = []
+            for value in values:
+                try:
+                    dates.append(np.datetime64(value or 'NaT', 'D'))
+                except ValueError:
+                    dates.append(np.datetime64('NaT', 'D'))
+            return np.array(dates, dtype='datetime64[D]')
+
+    def _genre_names(self) -> Dict[int, str]:
+        names = {genre['id']: genre['name'] for genre in self.db.get_all_genres()}
+        names[-1] = 'Не указан'
+        return names
+
+    def rating_percentiles_by_genre(self, percentiles: Sequence[float] = (25, 50, 75)) -> List[Dict[str, Any]]:
+        """Перцентили оценок по жанрам (только аниме с оценкой), по убыванию медианы.
+
+        Оценки - целые 1-10, поэтому вместо сортировки строится таблица частот
+        жанр x оценка, а перцентили (с линейной интерполяцией, как np.percentile)
+        берутся по накопленным частотам.
+        """
+        rated = ~np.isnan(self.rating)
+        if not rated.any():
+            return []
+
+        # Строка таблицы - жанр (ID + 1, чтобы "без жанра" было нулевой строкой), столбец - оценка
+        rows = self.genre_id[rated].astype(np.int64) + 1
+        ratings = self.rating[rated].astype(np.int64)
+        width = RATING_MAX + 1
+        counts = np.bincount(rows * width + ratings, minlength=(rows.max() + 1) * width).reshape(-1, width)
+        cumulative = counts.cumsum(axis=1)
+
+        names = self._genre_names()
+        result = []
+        for row in np.flatnonzero(cumulative[:, -1]):
+            total = cumulative[row, -1]
+            positions = np.asarray(percentiles, dtype=np.float64) / 100 * (total - 1)
+            # k-я по порядку оценка (с нуля) - первая, у которой накопленная частота больше k
+            lower = np.searchsorted(cumulative[row], np.floor(positions), side='right')
+            upper = np.searchsorted(cumulative[row], np.ceil(positions), side='right')
+            values = lower + (upper - lower) * (positions - np.floor(positions))
+            result.append({
+                'genre': names.get(int(row) - 1, 'Не указан'),
+                'count': int(total),
+                'percentiles': [round(float(value), 2) for value in values],
+            })
+        result.sort(key=lambda item: item['percentiles'][len(percentiles) // 2], reverse=True)
+        return result
+
+    def completion_ratios(self) -> Dict[str, Any]:
+        """Доля просмотренных эпизодов: в целом, в среднем по аниме и по статусам"""
+        has_total = self.total_episodes > 0
+        total = self.total_episodes[has_total].astype(np.float64)
+        watched = np.minimum(self.watched_episodes[has_total], self.total_episodes[has_total])
+        if not len(total):
+            return {'overall': 0.0, 'mean': 0.0, 'finished_share': 0.0, 'by_status': {}}
+
+        ratios = watched / total
+        status = self.status[has_total]
+        valid = status >= 0
+        sums = np.bincount(status[valid], weights=ratios[valid], minlength=len(ANIME_STATUSES))
+        counts = np.bincount(status[valid], minlength=len(ANIME_STATUSES))
+
+        return {
+            'overall': round(float(watched.sum() / total.sum()), 4),
+            'mean': round(float(ratios.mean()), 4),
+            'finished_share': round(float((ratios >= 1).mean()), 4),
+            'by_status': {
+                name: round(float(sums[code] / counts[code]), 4)
+                for code, name in enumerate(ANIME_STATUSES) if counts[code]
+            },
+        }
+
+    def watch_time_distribution(self, bins: int = 10) -> List[Dict[str, Any]]:
+        """Гистограмма времени просмотра одного аниме в часах (без непросмотренных)"""
+        hours = self.watched_episodes[self.watched_episodes > 0] * (EPISODE_MINUTES / 60)
+        if not len(hours):
+            return []
+
+        counts, edges = np.histogram(hours, bins=bins)
+        return [
+            {'from': round(float(edges[i]), 1), 'to': round(float(edges[i + 1]), 1), 'count': int(counts[i])}
+            for i in range(len(counts))
+        ]
+
+    def year_genre_crosstab(self) -> Dict[str, Any]:
+        """Количество аниме по году окончания и жанру: years, genres и матрица counts[год][жанр]"""
+        finished = ~np.isnat(self.finish_date)
+        if not finished.any():
+            return {'years': [], 'genres': [], 'counts': []}
+
+        years = self.finish_date[finished].astype('datetime64[Y]').astype(np.int64) + 1970
+        first_year = years.min()
+        rows = years - first_year
+        columns = self.genre_id[finished].astype(np.int64) + 1
+        width = columns.max() + 1
+        counts = np.bincount(rows * width + columns, minlength=(rows.max() + 1) * width).reshape(-1, width)
+
+        # Оставляем только годы и жанры, в которых что-то есть
+        year_rows = np.flatnonzero(counts.sum(axis=1))
+        genre_columns = np.flatnonzero(counts.sum(axis=0))
+        names = self._genre_names()
+        return {
+            'years': [int(first_year + row) for row in year_rows],
+            'genres': [names.get(int(column) - 1, 'Не указан') for column in genre_columns],
+            'counts': counts[np.ix_(year_rows, genre_columns)].tolist(),
+        }
+
+    def analytics(self) -> Dict[str, Any]:
+        """Обновляет снимок и считает всю аналитику разом (для фонового потока)"""
+        self.refresh()
+        return {
+            'total': len(self),
+            'rating_percentiles': self.rating_percentiles_by_genre(),
+            'completion': self.completion_ratios(),
+            'watch_time': self.watch_time_distribution(),
+            'year_genre': self.year_genre_crosstab(),
+        }
@@ -0,0 +1,35 @@
+import sys
+import os
+import tempfile
+from database import Database
+
+
+def main():
+    """Проверяет планы запросов Database: без полного сканирования anime с сортировкой во временном B-дереве"""
+    if len(sys.argv) > 1:
+        db_path = sys.argv[1]
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(), "query_plans.db")
+
+    db = Database(db_path)
+    db.init_db()
+
+    plans = db.explain_query_plans()
+    for sql, details in plans.items():
+        print(sql)
+        for detail in details:
+            print(f"    {detail}")
+
+    problems = db.check_query_plans(plans)
+    db.close()
+
+    if problems:
+        print(f"\nЗапросы с полным сканированием и временной сортировкой ({len(problems)}):")
+        print("\n".join(problems))
+        sys.exit(1)
+
+    print("\nВсе запросы используют индексы")
+
+
+if __name__ == "__main__":
+    main()
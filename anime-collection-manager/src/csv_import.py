@@ -0,0 +1,297 @@
+import csv
+import io
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple, List
+
+from database import ANIME_STATUSES
+
+# Поля, без которых импорт не имеет смысла
+REQUIRED_FIELDS = ('title', 'status')
+
+# Файлы больше этого размера разбираются параллельно в нескольких процессах
+PARALLEL_MIN_BYTES = 64 * 1024 * 1024
+
+# Размер диапазона файла, который разбирает один процесс за раз
+PARALLEL_RANGE_BYTES = 4 * 1024 * 1024
+
+# Форматы дат, которые встречаются в выгрузках; в базу даты пишутся как ГГГГ-ММ-ДД
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%Y/%m/%d', '%Y-%m-%dT%H:%M:%S')
+
+
+def normalize_date(value: Optional[str]) -> Optional[str]:
+    """Приводит дату к формату ГГГГ-ММ-ДД (нераспознанная дата отбрасывается)"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_row(row: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Проверяет и нормализует строку CSV.
+
+    Возвращает (данные аниме, None) или (None, текст ошибки).
+    """
+    title = (row.get('title') or '').strip()
+    if not title:
+        return None, "Отсутствует название"
+
+    # Неизвестный статус заменяется значением по умолчанию
+    status = (row.get('status') or '').strip()
+    if status not in ANIME_STATUSES:
+        status = 'Запланировано'
+
+    # Оценка вне диапазона 1-10 не импортируется
+    rating_str = (row.get('rating') or '').strip()
+    rating = None
+    if rating_str.isdecimal() and 1 <= int(rating_str) <= 10:
+        rating = int(rating_str)
+
+    total_str = (row.get('total_episodes') or '').strip()
+    watched_str = (row.get('watched_episodes') or '').strip()
+    total_episodes = int(total_str) if total_str.isdecimal() else 0
+    watched_episodes = int(watched_str) if watched_str.isdecimal() else 0
+
+    # Просмотренных эпизодов не может быть больше общего количества
+    if watched_episodes > total_episodes:
+        watched_episodes = total_episodes
+
+    return {
+        'title': title,
+        'studio': (row.get('studio') or '').strip(),
+        'genre': (row.get('genre') or '').strip() or None,
+        'type': (row.get('type') or '').strip() or 'TV Сериал',
+        'status': status,
+        'start_date': normalize_date(row.get('start_date')),
+        'finish_date': normalize_date(row.get('finish_date')),
+        'rating': rating,
+        'total_episodes': total_episodes,
+        'watched_episodes': watched_episodes,
+        'review': (row.get('review') or '').strip(),
+        'poster_image': None  # Постеры из CSV не импортируем
+    }, None
+
+
+def check_header(fieldnames) -> None:
+    """Проверяет заголовок CSV, при ошибке выбрасывает ValueError с понятным сообщением"""
+    if not fieldnames:
+        raise ValueError("CSV файл пустой или поврежден")
+
+    missing_fields = [field for field in REQUIRED_FIELDS if field not in fieldnames]
+    if missing_fields:
+        raise ValueError(f"В CSV файле отсутствуют обязательные поля: {', '.join(missing_fields)}")
+
+
+def read_header(file_path: str) -> Tuple[List[str], int]:
+    """Читает заголовок CSV, возвращает (поля, смещение первой записи в байтах)"""
+    with open(file_path, 'rb') as f:
+        data = b''
+        # Заголовок может содержать переводы строк внутри кавычек
+        while True:
+            line = f.readline()
+            data += line
+            if not line or data.count(b'"') % 2 == 0:
+                break
+        fieldnames = next(csv.reader(io.StringIO(data.decode('utf-8'), newline='')), None)
+        return fieldnames, f.tell()
+
+
+def split_ranges(file_path: str, start: int, range_size: int,
+                 block_size: int = 1024 * 1024) -> List[Tuple[int, int]]:
+    """Делит файл с позиции start на диапазоны байт примерно по range_size.
+
+    Границы ставятся только после перевода строки вне кавычек (по четности
+    числа кавычек от начала данных), поэтому каждый диапазон содержит целые записи.
+    """
+    size = os.path.getsize(file_path)
+    boundaries = [start]
+    target = start + range_size
+    in_quotes = False
+
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        while target < size:
+            block = f.read(block_size)
+            if not block:
+                break
+
+            i = 0
+            while i < len(block) and target < size:
+                if pos + i < target:
+                    # До цели только считаем кавычки
+                    end = min(target - pos, len(block))
+                    newline = False
+                else:
+                    found = block.find(b'\n', i)
+                    newline = found >= 0
+                    end = found + 1 if newline else len(block)
+
+                if block.count(b'"', i, end) % 2:
+                    in_quotes = not in_quotes
+                i = end
+
+                if newline and not in_quotes:
+                    boundaries.append(pos + i)
+                    target = pos + i + range_size
+            pos += len(block)
+
+    boundaries.append(size)
+    return [(begin, end) for begin, end in zip(boundaries, boundaries[1:]) if begin < end]
+
+
+def parse_range(file_path: str, begin: int, end: int,
+                fieldnames: List[str]) -> List[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+    """Разбирает и нормализует записи из диапазона байт файла (выполняется в отдельном процессе)"""
+    with open(file_path, 'rb') as f:
+        f.seek(begin)
+        text = f.read(end - begin).decode('utf-8')
+    reader = csv.DictReader(io.StringIO(text, newline=''), fieldnames=fieldnames)
+    return [normalize_row(row) for row in reader]
+
+
+class CsvImporter:
+    """Потоковый импорт CSV: чтение порциями, нормализация и запись пакетами в транзакциях.
+
+    Файл не загружается в память целиком: в каждый момент в памяти одна порция строк.
+    Номер строки в ошибках - номер записи плюс строка заголовка ("Строка 2" - первая запись).
+
+    Большие файлы разбираются параллельно: файл делится на диапазоны по границам
+    записей, диапазоны проверяются в ProcessPoolExecutor, а запись в базу идет
+    в этом потоке строго по порядку диапазонов (workers=1 - всегда последовательно).
+    """
+
+    def __init__(self, db, file_path: str, chunk_size: int = 1000,
+                 workers: Optional[int] = None, on_duplicate: str = 'add'):
+        self.db = db
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        # Что делать с аниме, которое уже есть в коллекции (см. DUPLICATE_MODES в database)
+        self.on_duplicate = on_duplicate
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+
+        self.imported = 0
+        self.skipped = 0
+        self.errors: List[Tuple[int, str]] = []
+        self.cancelled = False
+
+    def run(self, progress=None) -> bool:
+        """Импортирует файл.
+
+        progress(прочитано байт, размер файла, обработано записей, записей в секунду)
+        вызывается после каждой порции; если он возвращает False, импорт
+        останавливается (уже записанные порции остаются в базе).
+        Возвращает True, если файл обработан до конца.
+        """
+        total_bytes = os.path.getsize(self.file_path)
+        if self.workers > 1 and total_bytes >= PARALLEL_MIN_BYTES:
+            return self._run_parallel(progress, total_bytes)
+
+        started = time.perf_counter()
+        processed = 0
+
+        with open(self.file_path, 'rb') as raw:
+            text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            reader = csv.DictReader(text)
+            check_header(reader.fieldnames)
+
+            chunk = []
+            for row in reader:
+                chunk.append(row)
+                if len(chunk) >= self.chunk_size:
+                    self._import_chunk(chunk, processed)
+                    processed += len(chunk)
+                    chunk = []
+                    if not self._report(progress, raw.tell(), total_bytes, processed, started):
+                        self.cancelled = True
+                        return False
+
+            if chunk:
+                self._import_chunk(chunk, processed)
+                processed += len(chunk)
+            self._report(progress, total_bytes, total_bytes, processed, started)
+
+        return True
+
+    def _run_parallel(self, progress, total_bytes: int) -> bool:
+        """Параллельный разбор диапазонов файла с записью в базу по порядку"""
+        fieldnames, data_start = read_header(self.file_path)
+        check_header(fieldnames)
+
+        started = time.perf_counter()
+        processed = 0
+        ranges = deque(split_ranges(self.file_path, data_start, PARALLEL_RANGE_BYTES))
+        # Не больше двух диапазонов на процесс, чтобы разобранные записи не копились в памяти
+        max_in_flight = self.workers * 2
+
+        # fork в многопоточном процессе (GUI и поток базы с открытым соединением) небезопасен;
+        # разбору нужен только код модуля, поэтому процессы запускаются через spawn
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            in_flight = deque()
+            while ranges or in_flight:
+                while ranges and len(in_flight) < max_in_flight:
+                    begin, end = ranges.popleft()
+                    in_flight.append((end, executor.submit(
+                        parse_range, self.file_path, begin, end, fieldnames
+                    )))
+
+                end, future = in_flight.popleft()
+                results = future.result()
+                self._write_chunk(results, processed)
+                processed += len(results)
+
+                if not self._report(progress, end, total_bytes, processed, started):
+                    for _, pending in in_flight:
+                        pending.cancel()
+                    self.cancelled = True
+                    return False
+
+        return True
+
+    def _import_chunk(self, rows: List[Dict[str, Any]], first_index: int):
+        """Нормализует порцию строк и записывает ее одним пакетом"""
+        self._write_chunk([normalize_row(row) for row in rows], first_index)
+
+    def _write_chunk(self, results: List[Tuple[Optional[Dict[str, Any]], Optional[str]]],
+                     first_index: int):
+        """Записывает нормализованную порцию; first_index - номер первой записи порции в файле"""
+        records = []
+        record_lines = []
+        for offset, (anime_data, error) in enumerate(results):
+            line = first_index + offset + 2
+            if error:
+                self.errors.append((line, error))
+                self.skipped += 1
+                continue
+            records.append(anime_data)
+            record_lines.append(line)
+
+        inserted, insert_errors = self.db.add_anime_many(
+            records, batch_size=self.chunk_size, on_duplicate=self.on_duplicate
+        )
+        self.imported += inserted
+        for index, message in insert_errors:
+            self.errors.append((record_lines[index], message))
+        self.skipped += len(insert_errors)
+
+    @staticmethod
+    def _report(progress, done_bytes, total_bytes, processed, started) -> bool:
+        if not progress:
+            return True
+        elapsed = time.perf_counter() - started
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        return progress(done_bytes, total_bytes, processed, rate) is not False
+
+    def error_lines(self) -> List[str]:
+        """Ошибки импорта в виде строк отчета, по порядку строк файла"""
+        return [f"Строка {line}: {message}" for line, message in sorted(self.errors)]
@@ -1,97 +1,979 @@
 import sqlite3
 import os
+import hashlib
+import re
+import tempfile
+import threading
+import unicodedata
+import uuid
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Iterable
 import json
+from query_stats import QueryStats, InstrumentedConnection, instrumented
+from record_cache import RecordCache
+
+
+# Колонки списка аниме: все, что нужно таблице и экспорту, но без BLOB постера
+ANIME_LIST_COLUMNS = '''
+    a.id, a.title, a.studio, a.type, a.status, a.start_date, a.finish_date,
+    a.rating, a.review, a.total_episodes, a.watched_episodes, a.created_at,
+    a.poster_hash IS NOT NULL AS has_poster, g.name AS genre_name
+'''
+
+# Полная запись аниме: колонки списка, служебные поля и сам постер из хранилища
+ANIME_DETAIL_COLUMNS = ANIME_LIST_COLUMNS + '''
+    , a.genre_id, a.updated_at, a.poster_hash, p.data AS poster_image
+'''
+
+# Допустимые значения, совпадают с CHECK-ограничениями таблицы anime
+ANIME_TYPES = ('TV Сериал', 'Фильм', 'OVA/OAD', 'ONA', 'Спешл')
+ANIME_STATUSES = ('Запланировано', 'Смотрю', 'Просмотрено', 'Отложено', 'Брошено')
+
+# Поля, которые можно менять через patch_anime (жанр передается по имени)
+PATCHABLE_FIELDS = (
+    'title', 'studio', 'genre', 'type', 'status', 'start_date', 'finish_date',
+    'rating', 'review', 'total_episodes', 'watched_episodes'
+)
+
+INSERT_ANIME_SQL = '''
+    INSERT INTO anime
+    (title, studio, genre_id, type, status, start_date, finish_date,
+     rating, review, poster_hash, total_episodes, watched_episodes, title_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# Режимы add_anime_many для записей, название которых уже есть в коллекции:
+# add - добавить еще одну, skip - пропустить, update - перезаписать существующую,
+# merge - дополнить пустые поля существующей
+DUPLICATE_MODES = ('add', 'skip', 'update', 'merge')
+
+# Обновление существующего аниме данными импорта (постер не затрагивается)
+UPDATE_DUPLICATE_SQL = '''
+    UPDATE anime
+    SET title = ?, studio = ?, genre_id = ?, type = ?, status = ?,
+        start_date = ?, finish_date = ?, rating = ?, review = ?,
+        total_episodes = ?, watched_episodes = ?, title_key = ?,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+
+# Дополнение существующего аниме: заполненные поля сохраняются, пустые берутся из импорта,
+# по эпизодам берется большее значение
+MERGE_DUPLICATE_SQL = '''
+    UPDATE anime
+    SET studio = COALESCE(NULLIF(studio, ''), ?),
+        genre_id = COALESCE(genre_id, ?),
+        type = COALESCE(type, ?),
+        start_date = COALESCE(NULLIF(start_date, ''), ?),
+        finish_date = COALESCE(NULLIF(finish_date, ''), ?),
+        rating = COALESCE(rating, ?),
+        review = COALESCE(NULLIF(review, ''), ?),
+        total_episodes = MAX(COALESCE(total_episodes, 0), ?),
+        watched_episodes = MAX(COALESCE(watched_episodes, 0), ?),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+
+# Латинские и кириллические буквы, которые выглядят одинаково (после casefold)
+LATIN_LOOKALIKES = 'abcehkmoptxy'
+CYRILLIC_LOOKALIKES = 'авсенкмортху'
+LATIN_TO_CYRILLIC = str.maketrans(LATIN_LOOKALIKES, CYRILLIC_LOOKALIKES)
+
+# Размер порции, которой постер из файла хешируется и записывается в BLOB
+POSTER_CHUNK_SIZE = 256 * 1024
+
+# Веса bm25 для колонок полнотекстового индекса: название, студия, отзыв
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0)
+
+# Нечеткий поиск: сколько кандидатов берется из триграммного индекса для пересортировки
+# и минимальное сходство (Жаккар по триграммам), с которым название попадает в результат
+FUZZY_CANDIDATES = 200
+FUZZY_MIN_SIMILARITY = 0.25
+
+# Измерения сводной статистики: ключ группы как выражение над строкой anime
+# ({row} - NEW/OLD в триггерах или anime при пересчете)
+STATS_DIMENSIONS = {
+    'total': "''",
+    'status': "{row}.status",
+    'genre': "{row}.genre_id",
+    'type': "{row}.type",
+    'rating': "{row}.rating",
+    'year': "strftime('%Y', {row}.finish_date)",
+    'month': "strftime('%Y-%m', {row}.finish_date)",
+}
+
+# Величины, которые накапливаются для каждой группы
+STATS_MEASURES = {
+    'count': "1",
+    'rating_sum': "COALESCE({row}.rating, 0)",
+    'rating_count': "{row}.rating IS NOT NULL",
+    'total_episodes': "MAX(COALESCE({row}.total_episodes, 0), 0)",
+    'watched_episodes': "MAX(COALESCE({row}.watched_episodes, 0), 0)",
+}
+
+
+def normalize_title(title: Optional[str]) -> Optional[str]:
+    """Ключ названия для поиска дубликатов.
+
+    NFKC, casefold, ё -> е, диакритика у латинских букв снимается; в смешанных
+    словах и словах целиком из букв-двойников латинские двойники заменяются
+    кириллическими (всегда в одну сторону, чтобы ключи совпадали); пунктуация
+    и пробелы отбрасываются.
+    Для названия без букв и цифр возвращает None.
+    """
+    if not title:
+        return None
+
+    text = unicodedata.normalize('NFKC', title).casefold().replace('ё', 'е')
+
+    # shippūden -> shippuden, но й остается й
+    chars = []
+    for char in unicodedata.normalize('NFKD', text):
+        if unicodedata.combining(char) and chars and 'a' <= chars[-1] <= 'z':
+            continue
+        chars.append(char)
+    text = unicodedata.normalize('NFC', ''.join(chars))
+
+    words = []
+    for word in re.findall(r'\w+', text):
+        cyrillic = any('а' <= char <= 'я' for char in word)
+        latin = any('a' <= char <= 'z' for char in word)
+        # Смешанное слово (Ataкa) или слово целиком из двойников (MACTEP, Сat) -
+        # двойники всегда приводятся к кириллице, так что "MACTEP" и "Мастер" совпадут
+        if (cyrillic and latin) or all(char in LATIN_LOOKALIKES or char in CYRILLIC_LOOKALIKES
+                                       for char in word if char.isalpha()):
+            word = word.translate(LATIN_TO_CYRILLIC)
+        words.append(word.replace('_', ''))
+
+    return ''.join(words) or None
 
 
 class Database:
-    def __init__(self, db_path: str = "anime_manager.db"):
+    # Настройки соединения: инкрементальная очистка (для новой базы; существующую
+    # переводит maintenance), WAL-журнал, кэш страниц ~16 МБ, mmap 64 МБ
+    PRAGMAS = (
+        "PRAGMA auto_vacuum = INCREMENTAL",
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -16000",
+        "PRAGMA mmap_size = 67108864",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA busy_timeout = 5000",
+    )
+
+    def __init__(self, db_path: str = "anime_manager.db", slow_query_ms: float = 100.0,
+                 slow_log_path: Optional[str] = None, record_cache_bytes: int = 32 * 1024 * 1024,
+                 persist_statistics: bool = True):
         self.db_path = db_path
-        self.connection = None
+        self.query_stats = QueryStats(slow_query_ms, slow_log_path)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._fts_enabled = None
+        self._trigram_enabled = None
+
+        # Кэш справочника жанров: список, имя -> ID и ID -> имя
+        self._genres = None
+        self._genre_ids = {}
+        self._genre_names = {}
+        self._genres_lock = threading.Lock()
+
+        # Кэш полных записей get_anime (с постерами), сбрасывается при изменении записи
+        self.record_cache = RecordCache(record_cache_bytes)
+
+        # Кэш статистики: (ревизия базы, статистика); копия хранится в JSON рядом с базой,
+        # чтобы и первое открытие статистики после перезапуска не пересчитывало ее
+        self._statistics_cache = None
+        self._statistics_cache_loaded = False
+        self._statistics_cache_lock = threading.Lock()
+        self.statistics_cache_path = (
+            f"{db_path}.stats.json" if persist_statistics and db_path != ':memory:' else None
+        )
+
+    @property
+    def connection(self) -> Optional[sqlite3.Connection]:
+        """Соединение текущего потока (None, если еще не открыто)"""
+        return getattr(self._local, 'connection', None)
 
     def connect(self):
-        """Устанавливает соединение с базой данных"""
-        self.connection = sqlite3.connect(self.db_path)
-        self.connection.row_factory = sqlite3.Row
-        return self.connection
+        """Возвращает соединение текущего потока, открывая его при первом обращении"""
+        conn = self.connection
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                   factory=InstrumentedConnection)
+            conn.row_factory = sqlite3.Row
+            conn.query_stats = self.query_stats
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+            self._local.connection = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
 
     def close(self):
-        """Закрывает соединение с базой данных"""
-        if self.connection:
-            self.connection.close()
+        """Закрывает все открытые соединения с базой данных"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"Error closing database connection: {e}")
+        self._local = threading.local()
+        self.query_stats.close()
 
-    def init_db(self):
-        """Инициализирует базу данных (создает таблицы если их нет)"""
-        with self.connect() as conn:
-            cursor = conn.cursor()
+    def change_token(self) -> Tuple[str, int]:
+        """Дешевый признак изменения данных - ревизия базы (см. revision()).
+
+        Ревизию повышают только изменения аниме и жанров, поэтому служебные записи
+        (incremental_vacuum, ANALYZE) не считаются изменением данных. Токены сравнимы
+        между потоками и процессами.
+        """
+        revision = self.revision()
+        data_version = self.connect().execute("PRAGMA data_version").fetchone()[0]
+        last = getattr(self._local, 'change_state', None)
+        if last is not None and data_version != last[0] and revision != last[1]:
+            # Данные изменило другое соединение - записи в кэше могли устареть
+            self.record_cache.clear()
+        self._local.change_state = (data_version, revision)
+        return revision
+
+    # Шаги миграции схемы; после шага N в PRAGMA user_version записывается N
+    MIGRATIONS = (
+        '_migration_base_schema',
+        '_migration_poster_store',
+        '_migration_search_index',
+        '_migration_indexes',
+        '_migration_statistics_summary',
+        '_migration_title_key',
+        '_migration_trigram_index',
+        '_migration_updated_index',
+        '_migration_revision',
+        '_migration_title_key_lookalikes',
+    )
+
+    @instrumented
+    def init_db(self, progress=None):
+        """Приводит схему базы к текущей версии (на актуальной базе не выполняет DDL)"""
+        self.migrate(progress)
+
+    def schema_version(self) -> int:
+        """Возвращает версию схемы базы (PRAGMA user_version)"""
+        return self.connect().execute("PRAGMA user_version").fetchone()[0]
+
+    def pending_migrations(self) -> int:
+        """Возвращает количество еще не примененных шагов миграции"""
+        return max(len(self.MIGRATIONS) - self.schema_version(), 0)
+
+    def migrate(self, progress=None):
+        """Применяет недостающие шаги миграции.
+
+        Шаг - генератор: после каждой порции работы он отдает сообщение, порция
+        фиксируется отдельной транзакцией и вызывается progress(шаг, всего шагов, сообщение).
+        Версия схемы повышается только после завершения шага, поэтому прерванный
+        шаг при следующем запуске продолжится с того же места.
+        """
+        version = self.schema_version()
+        if version >= len(self.MIGRATIONS):
+            return
+
+        conn = self.connect()
+        for number, name in enumerate(self.MIGRATIONS, start=1):
+            if number <= version:
+                continue
+
+            conn.execute("BEGIN")
+            try:
+                for message in getattr(self, name)(conn.cursor()):
+                    conn.commit()
+                    if progress:
+                        progress(number, len(self.MIGRATIONS), message)
+                    conn.execute("BEGIN")
+                conn.execute(f"PRAGMA user_version = {number}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        self.invalidate_genre_cache()
+        self.record_cache.clear()
+        self._fts_enabled = None
+        self._trigram_enabled = None
 
-            # Таблица жанров аниме
+    def _migration_base_schema(self, cursor):
+        """Шаг 1: таблицы жанров и аниме, стандартные жанры"""
+        # Таблица жанров аниме
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS genres (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL
+            )
+        ''')
+
+        # Таблица аниме
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS anime (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                studio TEXT,
+                genre_id INTEGER,
+                type TEXT CHECK(type IN ('TV Сериал', 'Фильм', 'OVA/OAD', 'ONA', 'Спешл')),
+                status TEXT CHECK(status IN ('Запланировано', 'Смотрю', 'Просмотрено', 'Отложено', 'Брошено')),
+                start_date TEXT,
+                finish_date TEXT,
+                rating INTEGER CHECK(rating >= 1 AND rating <= 10),
+                review TEXT,
+                poster_hash TEXT,
+                total_episodes INTEGER DEFAULT 0,
+                watched_episodes INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (genre_id) REFERENCES genres (id)
+            )
+        ''')
+
+        # Добавляем стандартные жанры аниме
+        default_genres = [
+            'Сёнен', 'Сёдзё', 'Сейнен', 'Дзёсей', 'Комедия', 'Драма',
+            'Романтика', 'Фэнтези', 'Научная фантастика', 'Хоррор',
+            'Мистика', 'Приключения', 'Этти', 'Меха', 'Спокон',
+            'Повседневность', 'Гурман', 'Исекай', 'Махо-сёдзё'
+        ]
+        cursor.executemany(
+            "INSERT OR IGNORE INTO genres (name) VALUES (?)",
+            [(genre,) for genre in default_genres]
+        )
+        yield "Созданы основные таблицы"
+
+    def _migration_poster_store(self, cursor, chunk_size: int = 50):
+        """Шаг 2: хранилище постеров и перенос старых BLOB из таблицы anime порциями"""
+        # Хранилище постеров: одно изображение на хеш содержимого
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS posters (
+                hash TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                size INTEGER NOT NULL
+            )
+        ''')
+
+        # Старые базы: постер лежал прямо в строке anime
+        if not self._column_exists(cursor, 'anime', 'poster_hash'):
+            cursor.execute("ALTER TABLE anime ADD COLUMN poster_hash TEXT")
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_anime_poster_hash ON anime (poster_hash)")
+
+        # Постер удаляется, когда на него больше не ссылается ни одно аниме
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS anime_poster_release_on_delete
+            AFTER DELETE ON anime
+            WHEN OLD.poster_hash IS NOT NULL
+            BEGIN
+                DELETE FROM posters
+                WHERE hash = OLD.poster_hash
+                  AND NOT EXISTS (SELECT 1 FROM anime WHERE poster_hash = OLD.poster_hash);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS anime_poster_release_on_update
+            AFTER UPDATE OF poster_hash ON anime
+            WHEN OLD.poster_hash IS NOT NULL AND OLD.poster_hash IS NOT NEW.poster_hash
+            BEGIN
+                DELETE FROM posters
+                WHERE hash = OLD.poster_hash
+                  AND NOT EXISTS (SELECT 1 FROM anime WHERE poster_hash = OLD.poster_hash);
+            END
+        ''')
+        yield "Создано хранилище постеров"
+
+        if not self._column_exists(cursor, 'anime', 'poster_image'):
+            return
+
+        cursor.execute("SELECT COUNT(*) FROM anime WHERE poster_image IS NOT NULL")
+        total = cursor.fetchone()[0]
+        moved = 0
+        last_id = 0
+        while True:
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS genres (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT UNIQUE NOT NULL
+                SELECT id, poster_image FROM anime
+                WHERE id > ? AND poster_image IS NOT NULL
+                ORDER BY id
+                LIMIT ?
+            ''', (last_id, chunk_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            for row in rows:
+                poster_hash = self._store_poster(cursor, row['poster_image'])
+                cursor.execute(
+                    "UPDATE anime SET poster_hash = ?, poster_image = NULL WHERE id = ?",
+                    (poster_hash, row['id'])
                 )
-            ''')
+            moved += len(rows)
+            last_id = rows[-1]['id']
+            yield f"Перенесено постеров: {moved} из {total}"
 
-            # Таблица аниме
+    def _migration_search_index(self, cursor):
+        """Шаг 3: полнотекстовый индекс FTS5 по названию, студии и отзыву"""
+        try:
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS anime (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    studio TEXT,
-                    genre_id INTEGER,
-                    type TEXT CHECK(type IN ('TV Сериал', 'Фильм', 'OVA/OAD', 'ONA', 'Спешл')),
-                    status TEXT CHECK(status IN ('Запланировано', 'Смотрю', 'Просмотрено', 'Отложено', 'Брошено')),
-                    start_date TEXT,
-                    finish_date TEXT,
-                    rating INTEGER CHECK(rating >= 1 AND rating <= 10),
-                    review TEXT,
-                    poster_image BLOB,
-                    total_episodes INTEGER DEFAULT 0,
-                    watched_episodes INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (genre_id) REFERENCES genres (id)
+                CREATE VIRTUAL TABLE IF NOT EXISTS anime_fts USING fts5(
+                    title, studio, review,
+                    content='anime', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
                 )
             ''')
+        except sqlite3.OperationalError as e:
+            # SQLite собран без FTS5 - поиск останется на LIKE
+            print(f"Full-text search is unavailable: {e}")
+            return
 
-            # Добавляем стандартные жанры аниме
-            default_genres = [
-                'Сёнен', 'Сёдзё', 'Сейнен', 'Дзёсей', 'Комедия', 'Драма',
-                'Романтика', 'Фэнтези', 'Научная фантастика', 'Хоррор',
-                'Мистика', 'Приключения', 'Этти', 'Меха', 'Спокон',
-                'Повседневность', 'Гурман', 'Исекай', 'Махо-сёдзё'
-            ]
+        # Триггеры поддерживают индекс в актуальном состоянии
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS anime_fts_insert AFTER INSERT ON anime
+            BEGIN
+                INSERT INTO anime_fts (rowid, title, studio, review)
+                VALUES (NEW.id, NEW.title, NEW.studio, NEW.review);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS anime_fts_delete AFTER DELETE ON anime
+            BEGIN
+                INSERT INTO anime_fts (anime_fts, rowid, title, studio, review)
+                VALUES ('delete', OLD.id, OLD.title, OLD.studio, OLD.review);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS anime_fts_update AFTER UPDATE OF title, studio, review ON anime
+            BEGIN
+                INSERT INTO anime_fts (anime_fts, rowid, title, studio, review)
+                VALUES ('delete', OLD.id, OLD.title, OLD.studio, OLD.review);
+                INSERT INTO anime_fts (rowid, title, studio, review)
+                VALUES (NEW.id, NEW.title, NEW.studio, NEW.review);
+            END
+        ''')
+        yield "Создан поисковый индекс"
 
-            for genre in default_genres:
-                cursor.execute(
-                    "INSERT OR IGNORE INTO genres (name) VALUES (?)",
-                    (genre,)
+        # Индекс для уже существующих записей
+        cursor.execute("INSERT INTO anime_fts (anime_fts) VALUES ('rebuild')")
+        yield "Поисковый индекс построен"
+
+    def _migration_indexes(self, cursor):
+        """Шаг 4: вторичные индексы под фильтры, группировки и сортировку списка"""
+        indexes = [
+            # Покрывающие индексы для группировок статистики;
+            # idx_anime_stats заодно покрывает фильтр по статусу и общий подсчет
+            "idx_anime_stats ON anime (status, rating, total_episodes, watched_episodes)",
+            "idx_anime_rating ON anime (rating)",
+            "idx_anime_type ON anime (type)",
+            # Индексы по выражению для группировки по году и месяцу окончания
+            "idx_anime_finish_year ON anime (strftime('%Y', finish_date))",
+            "idx_anime_finish_month ON anime (strftime('%Y-%m', finish_date))",
+            # Сортировка списка по дате добавления без временного B-дерева,
+            # в том числе постранично с фильтром по статусу или жанру
+            "idx_anime_created ON anime (created_at, id)",
+            "idx_anime_status_created ON anime (status, created_at, id)",
+            "idx_anime_genre_created ON anime (genre_id, created_at, id)",
+        ]
+        for index in indexes:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index}")
+            yield f"Создан индекс {index.split()[0]}"
+
+    def _migration_statistics_summary(self, cursor):
+        """Шаг 5: сводная таблица статистики и триггеры, которые ее обновляют"""
+        # key без типа, чтобы оценки и ID жанров оставались числами
+        measures = ",\n".join(f"{name} INTEGER NOT NULL DEFAULT 0" for name in STATS_MEASURES)
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS anime_stats (
+                dimension TEXT NOT NULL,
+                key NOT NULL,
+                {measures},
+                PRIMARY KEY (dimension, key)
+            ) WITHOUT ROWID
+        ''')
+
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS anime_stats_insert AFTER INSERT ON anime
+            BEGIN
+                {self._stats_trigger_body('NEW', 1)}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS anime_stats_delete AFTER DELETE ON anime
+            BEGIN
+                {self._stats_trigger_body('OLD', -1)}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS anime_stats_update
+            AFTER UPDATE OF status, genre_id, type, rating, finish_date,
+                            total_episodes, watched_episodes ON anime
+            BEGIN
+                {self._stats_trigger_body('OLD', -1)}
+                {self._stats_trigger_body('NEW', 1)}
+            END
+        ''')
+        yield "Создана сводная статистика"
+
+        # Сводка по данным, которые были в базе до появления триггеров
+        for dimension in self._rebuild_statistics(cursor):
+            yield f"Пересчитана статистика: {dimension}"
+
+    def _migration_title_key(self, cursor, chunk_size: int = 1000):
+        """Шаг 6: ключ нормализованного названия для поиска дубликатов"""
+        if not self._column_exists(cursor, 'anime', 'title_key'):
+            cursor.execute("ALTER TABLE anime ADD COLUMN title_key TEXT")
+
+        # Функция нужна только для заполнения ключа здесь; дальше ключ вычисляется в Python
+        cursor.connection.create_function('normalize_title', 1, normalize_title, deterministic=True)
+
+        cursor.execute("SELECT COUNT(*) FROM anime")
+        total = cursor.fetchone()[0]
+        done = 0
+        last_id = 0
+        while True:
+            cursor.execute(
+                "SELECT MAX(id), COUNT(*) FROM (SELECT id FROM anime WHERE id > ? ORDER BY id LIMIT ?)",
+                (last_id, chunk_size)
+            )
+            chunk_end, count = cursor.fetchone()
+            if not count:
+                break
+            cursor.execute(
+                "UPDATE anime SET title_key = normalize_title(title) WHERE id > ? AND id <= ?",
+                (last_id, chunk_end)
+            )
+            last_id = chunk_end
+            done += count
+            yield f"Заполнены ключи названий: {done} из {total}"
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_anime_title_key ON anime (title_key)")
+        yield "Создан индекс idx_anime_title_key"
+
+    def _migration_title_key_lookalikes(self, cursor):
+        """Шаг 10: пересчет ключей названий - двойники теперь всегда приводятся к кириллице"""
+        yield from self._migration_title_key(cursor)
+
+    def _migration_trigram_index(self, cursor):
+        """Шаг 7: триграммный индекс FTS5 по названию для поиска с опечатками"""
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS anime_trigram USING fts5(
+                    title, content='anime', content_rowid='id', tokenize='trigram'
                 )
+            ''')
+        except sqlite3.OperationalError as e:
+            # Токенизатор trigram появился в SQLite 3.34 - без него нечеткого поиска не будет
+            print(f"Fuzzy search is unavailable: {e}")
+            return
 
-            conn.commit()
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS anime_trigram_insert AFTER INSERT ON anime
+            BEGIN
+                INSERT INTO anime_trigram (rowid, title) VALUES (NEW.id, NEW.title);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS anime_trigram_delete AFTER DELETE ON anime
+            BEGIN
+                INSERT INTO anime_trigram (anime_trigram, rowid, title)
+                VALUES ('delete', OLD.id, OLD.title);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS anime_trigram_update AFTER UPDATE OF title ON anime
+            BEGIN
+                INSERT INTO anime_trigram (anime_trigram, rowid, title)
+                VALUES ('delete', OLD.id, OLD.title);
+                INSERT INTO anime_trigram (rowid, title) VALUES (NEW.id, NEW.title);
+            END
+        ''')
+        yield "Создан триграммный индекс"
+
+        cursor.execute("INSERT INTO anime_trigram (anime_trigram) VALUES ('rebuild')")
+        yield "Триграммный индекс построен"
+
+    def _migration_updated_index(self, cursor):
+        """Шаг 8: индекс по времени изменения для инкрементального обновления снимка аналитики"""
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_anime_updated ON anime (updated_at)")
+        yield "Создан индекс idx_anime_updated"
+
+    def _migration_revision(self, cursor):
+        """Шаг 9: ревизия данных, которую триггеры повышают при каждом изменении аниме и жанров"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        # Идентификатор отличает базу от другой базы с той же ревизией (например, восстановленной копии)
+        cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('instance', ?)", (uuid.uuid4().hex,))
+        cursor.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0)")
+
+        triggers = {
+            'anime_revision_insert': 'AFTER INSERT ON anime',
+            'anime_revision_delete': 'AFTER DELETE ON anime',
+            'anime_revision_update': 'AFTER UPDATE ON anime',
+            # Статистика по жанрам показывает их названия
+            'genres_revision_update': 'AFTER UPDATE OF name ON genres',
+            'genres_revision_delete': 'AFTER DELETE ON genres',
+        }
+        for name, event in triggers.items():
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {name} {event}
+                BEGIN
+                    UPDATE meta SET value = value + 1 WHERE key = 'revision';
+                END
+            ''')
+        yield "Создан счетчик ревизий"
+
+    @staticmethod
+    def _stats_trigger_body(row: str, sign: int) -> str:
+        """Генерирует UPSERT-ы сводной статистики для строки NEW/OLD со знаком +1/-1"""
+        columns = ", ".join(STATS_MEASURES)
+        updates = ", ".join(f"{name} = {name} + excluded.{name}" for name in STATS_MEASURES)
+        statements = []
+        for dimension, expression in STATS_DIMENSIONS.items():
+            key = expression.format(row=row)
+            values = ", ".join(f"{sign} * ({measure.format(row=row)})" for measure in STATS_MEASURES.values())
+            statements.append(f'''
+                INSERT INTO anime_stats (dimension, key, {columns})
+                SELECT '{dimension}', {key}, {values}
+                WHERE {key} IS NOT NULL
+                ON CONFLICT (dimension, key) DO UPDATE SET {updates};
+            ''')
+        return "".join(statements)
+
+    @staticmethod
+    def _aggregate_statistics_sql(dimension: str) -> str:
+        """Запрос, который считает группы одного измерения напрямую по таблице anime"""
+        key = STATS_DIMENSIONS[dimension].format(row='anime')
+        sums = ", ".join(f"SUM({measure.format(row='anime')})" for measure in STATS_MEASURES.values())
+        return f'''
+            SELECT '{dimension}', {key}, {sums}
+            FROM anime
+            WHERE {key} IS NOT NULL
+            GROUP BY {key}
+        '''
+
+    @staticmethod
+    def _rebuild_statistics(cursor):
+        """Пересчитывает сводную таблицу статистики с нуля, отдавая имя каждого готового измерения"""
+        columns = ", ".join(STATS_MEASURES)
+        cursor.execute("DELETE FROM anime_stats")
+        for dimension in STATS_DIMENSIONS:
+            cursor.execute(
+                f"INSERT INTO anime_stats (dimension, key, {columns}) "
+                f"{Database._aggregate_statistics_sql(dimension)}"
+            )
+            yield dimension
+
+    @instrumented
+    def rebuild_statistics(self):
+        """Пересчитывает сводную статистику (если она разошлась с данными)"""
+        with self.connect() as conn:
+            for _ in self._rebuild_statistics(conn.cursor()):
+                pass
+
+    @instrumented
+    def check_statistics(self) -> bool:
+        """Проверяет, что сводная статистика совпадает с фактическими данными таблицы anime"""
+        cursor = self.connect().cursor()
+        columns = ", ".join(STATS_MEASURES)
+
+        cursor.execute(f"SELECT dimension, key, {columns} FROM anime_stats WHERE count > 0")
+        stored = {tuple(row) for row in cursor.fetchall()}
+
+        actual = set()
+        for dimension in STATS_DIMENSIONS:
+            cursor.execute(self._aggregate_statistics_sql(dimension))
+            actual.update(tuple(row) for row in cursor.fetchall())
+
+        return stored == actual
+
+    def get_query_stats(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """Возвращает счетчики вызовов методов и SQL-запросов"""
+        return self.query_stats.snapshot()
+
+    def query_stats_report(self) -> str:
+        """Возвращает счетчики вызовов методов и SQL-запросов в виде текстовой таблицы"""
+        cache = self.record_cache.stats()
+        return (
+            f"{self.query_stats.report()}\n\n"
+            f"Кэш записей: попаданий {cache['hits']}, промахов {cache['misses']}, "
+            f"записей {cache['entries']}, {cache['bytes']} из {cache['max_bytes']} байт"
+        )
+
+    def record_cache_stats(self) -> Dict[str, int]:
+        """Счетчики кэша записей get_anime: hits, misses, entries, bytes, max_bytes"""
+        return self.record_cache.stats()
+
+    def explain_query_plans(self) -> Dict[str, List[str]]:
+        """Выполняет типовые запросы Database и возвращает план (EXPLAIN QUERY PLAN) каждого SELECT"""
+        conn = self.connect()
+        statements = []
+        conn.set_trace_callback(statements.append)
+        try:
+            for name, call in self._query_plan_cases():
+                try:
+                    call()
+                except Exception as e:
+                    print(f"Query plan case '{name}' failed: {e}")
+        finally:
+            conn.set_trace_callback(None)
+
+        plans = {}
+        for sql in statements:
+            sql = " ".join(sql.split())
+            if not sql.upper().startswith(("SELECT", "WITH")) or sql in plans:
+                continue
+            cursor = conn.execute(f"EXPLAIN QUERY PLAN {sql}")
+            plans[sql] = [row['detail'] for row in cursor.fetchall()]
+        return plans
+
+    def check_query_plans(self, plans: Optional[Dict[str, List[str]]] = None) -> List[str]:
+        """Возвращает запросы, которые сканируют всю таблицу anime и сортируют через временное B-дерево"""
+        if plans is None:
+            plans = self.explain_query_plans()
+
+        problems = []
+        for sql, details in plans.items():
+            full_scan = any(
+                re.match(r'SCAN (anime|a)\b', detail) and 'USING' not in detail
+                for detail in details
+            )
+            temp_sort = any('USE TEMP B-TREE' in detail for detail in details)
+            if full_scan and temp_sort:
+                problems.append(f"{sql}\n    " + "\n    ".join(details))
+        return problems
+
+    def _query_plan_cases(self):
+        """Вызовы Database, запросы которых проверяет check_query_plans"""
+        return [
+            ('get_anime', lambda: (self.record_cache.invalidate(1), self.get_anime(1))),
+            ('get_anime_summary', lambda: self.get_anime_summary(1)),
+            ('get_anime_list', lambda: self.get_anime_list()),
+            ('get_anime_list_search', lambda: self.get_anime_list("аниме")),
+            ('get_all_anime', lambda: self.get_all_anime()),
+            ('get_anime_page', lambda: self.get_anime_page()),
+            ('get_anime_page_next', lambda: self.get_anime_page(after=("2024-01-01 00:00:00", 1))),
+            ('get_anime_page_status', lambda: self.get_anime_page(status='Смотрю')),
+            ('get_anime_page_genre', lambda: self.get_anime_page(genre='Сёнен', after=("2024-01-01 00:00:00", 1))),
+            ('get_anime_page_search', lambda: self.get_anime_page("аниме")),
+            ('count_anime', lambda: self.count_anime()),
+            ('search_fuzzy', lambda: self.search_fuzzy("атака титанав")),
+            ('find_duplicate', lambda: self.find_duplicate("Аниме")),
+            ('get_all_genres', lambda: (self.invalidate_genre_cache(), self.get_all_genres())),
+            ('get_statistics', lambda: self.get_statistics()),
+            ('revision', lambda: self.revision()),
+            ('export_to_csv', self._export_plan_case),
+        ]
+
+    def _export_plan_case(self):
+        """Экспорт во временный файл: отмена после первой порции, файл удаляется"""
+        fd, file_path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        try:
+            self.export_to_csv(file_path, progress=lambda exported, total: False)
+        finally:
+            # На пустой базе экспорт завершается без вызова progress и оставляет файл
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    @instrumented
+    def rebuild_search_index(self):
+        """Перестраивает полнотекстовый индекс по текущему содержимому таблицы anime"""
+        if not self.fts_enabled:
+            return
+        with self.connect() as conn:
+            conn.execute("INSERT INTO anime_fts (anime_fts) VALUES ('rebuild')")
+            conn.execute("INSERT INTO anime_fts (anime_fts) VALUES ('optimize')")
+            if self.trigram_enabled:
+                conn.execute("INSERT INTO anime_trigram (anime_trigram) VALUES ('rebuild')")
+                conn.execute("INSERT INTO anime_trigram (anime_trigram) VALUES ('optimize')")
+
+    @property
+    def fts_enabled(self) -> bool:
+        """Есть ли в базе полнотекстовый индекс"""
+        if self._fts_enabled is None:
+            cursor = self.connect().cursor()
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'anime_fts'")
+            self._fts_enabled = cursor.fetchone() is not None
+        return self._fts_enabled
+
+    @property
+    def trigram_enabled(self) -> bool:
+        """Есть ли в базе триграммный индекс для нечеткого поиска"""
+        if self._trigram_enabled is None:
+            cursor = self.connect().cursor()
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'anime_trigram'")
+            self._trigram_enabled = cursor.fetchone() is not None
+        return self._trigram_enabled
+
+    @staticmethod
+    def _trigrams(text: str) -> set:
+        """Триграммы слов строки (регистр и ё не различаются)"""
+        words = re.findall(r'\w+', (text or '').casefold().replace('ё', 'е'))
+        return {word[i:i + 3] for word in words for i in range(len(word) - 2)}
+
+    @instrumented
+    def search_fuzzy(self, search_text: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Ищет аниме по названию с опечатками (колонки списка и similarity от 0 до 1).
+
+        Кандидаты - названия с любой из триграмм запроса, отобранные bm25 по
+        триграммному индексу; затем они пересортировываются по сходству Жаккара.
+        """
+        query_trigrams = self._trigrams(search_text)
+        if not query_trigrams or not self.trigram_enabled:
+            return []
+
+        cursor = self.connect().cursor()
+        match = " OR ".join('"{}"'.format(trigram.replace('"', '""')) for trigram in query_trigrams)
+        cursor.execute('''
+            SELECT rowid AS id, title FROM anime_trigram
+            WHERE anime_trigram MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        ''', (match, FUZZY_CANDIDATES))
+
+        scored = []
+        for row in cursor.fetchall():
+            title_trigrams = self._trigrams(row['title'])
+            similarity = len(query_trigrams & title_trigrams) / len(query_trigrams | title_trigrams)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                scored.append((similarity, row['id']))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        scored = scored[:limit]
+        if not scored:
+            return []
+
+        placeholders = ", ".join("?" for _ in scored)
+        cursor.execute(f'''
+            SELECT {ANIME_LIST_COLUMNS}
+            FROM anime a
+            LEFT JOIN genres g ON a.genre_id = g.id
+            WHERE a.id IN ({placeholders})
+        ''', [anime_id for _, anime_id in scored])
+        rows = {row['id']: dict(row) for row in cursor.fetchall()}
+
+        result = []
+        for similarity, anime_id in scored:
+            if anime_id in rows:
+                rows[anime_id]['similarity'] = round(similarity, 3)
+                result.append(rows[anime_id])
+        return result
 
+    @staticmethod
+    def _fts_query(search_text: str) -> str:
+        """Превращает строку поиска в запрос FTS5: все слова как префиксы"""
+        words = re.findall(r'\w+', search_text)
+        return " ".join(f'"{word}"*' for word in words)
+
+    def _search_filter(self, search_text: str):
+        """Возвращает (join, where, params, order_by) для поиска по тексту"""
+        if not search_text:
+            return "", "", (), "a.created_at DESC"
+
+        fts_query = self._fts_query(search_text) if self.fts_enabled else ""
+        if fts_query:
+            join = f'''
+                JOIN (
+                    SELECT rowid, bm25(anime_fts, {", ".join(map(str, SEARCH_WEIGHTS))}) AS rank
+                    FROM anime_fts
+                    WHERE anime_fts MATCH ?
+                ) s ON s.rowid = a.id
+            '''
+            return join, "", (fts_query,), "s.rank, a.created_at DESC"
+
+        search_pattern = f"%{search_text}%"
+        return "", "WHERE a.title LIKE ? OR a.studio LIKE ?", (search_pattern, search_pattern), "a.created_at DESC"
+
+    @staticmethod
+    def _column_exists(cursor, table: str, column: str) -> bool:
+        """Проверяет, есть ли колонка в таблице"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row['name'] == column for row in cursor.fetchall())
+
+    @staticmethod
+    def _store_poster(cursor, poster_image: Optional[bytes]) -> Optional[str]:
+        """Сохраняет постер в хранилище и возвращает его хеш (одинаковые изображения хранятся один раз)"""
+        if not poster_image:
+            return None
+
+        poster_hash = hashlib.sha256(poster_image).hexdigest()
+        cursor.execute(
+            "INSERT OR IGNORE INTO posters (hash, data, size) VALUES (?, ?, ?)",
+            (poster_hash, poster_image, len(poster_image))
+        )
+        return poster_hash
+
+    @staticmethod
+    def _store_poster_file(cursor, file_path: str) -> Optional[str]:
+        """Сохраняет постер из файла, не загружая файл в память целиком.
+
+        Первый проход по файлу считает хеш. Если такого изображения еще нет, под него
+        резервируется zeroblob нужного размера, и файл записывается в BLOB порциями
+        через blobopen. Если файл изменился между проходами, выбрасывается ValueError.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(POSTER_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+        if not size:
+            return None
+
+        conn = cursor.connection
+        if not hasattr(conn, 'blobopen'):
+            # blobopen есть только в Python 3.11+
+            with open(file_path, 'rb') as f:
+                return Database._store_poster(cursor, f.read())
+
+        poster_hash = digest.hexdigest()
+        cursor.execute(
+            "INSERT OR IGNORE INTO posters (hash, data, size) VALUES (?, zeroblob(?), ?)",
+            (poster_hash, size, size)
+        )
+        if not cursor.rowcount:
+            # Такое изображение уже есть в хранилище
+            return poster_hash
+
+        written = hashlib.sha256()
+        with conn.blobopen('posters', 'data', cursor.lastrowid) as blob, open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(POSTER_CHUNK_SIZE), b''):
+                if blob.tell() + len(chunk) > size:
+                    raise ValueError("Файл постера изменился во время сохранения")
+                blob.write(chunk)
+                written.update(chunk)
+        if written.hexdigest() != poster_hash:
+            raise ValueError("Файл постера изменился во время сохранения")
+        return poster_hash
+
+    @classmethod
+    def _store_anime_poster(cls, cursor, anime_data: Dict[str, Any]) -> Optional[str]:
+        """Сохраняет постер записи: из файла poster_path (порциями) или из байтов poster_image"""
+        if anime_data.get('poster_path'):
+            return cls._store_poster_file(cursor, anime_data['poster_path'])
+        return cls._store_poster(cursor, anime_data.get('poster_image'))
+
+    @instrumented
     def add_anime(self, anime_data: Dict[str, Any]) -> int:
-        """Добавляет новое аниме в базу данных"""
+        """Добавляет новое аниме в базу данных.
+
+        Постер передается байтами в poster_image или путем к файлу в poster_path
+        (файл записывается в базу порциями, см. _store_poster_file).
+        """
         with self.connect() as conn:
             cursor = conn.cursor()
 
             # Получаем ID жанра по имени
-            genre_id = None
-            if anime_data.get('genre'):
-                cursor.execute("SELECT id FROM genres WHERE name = ?", (anime_data['genre'],))
-                result = cursor.fetchone()
-                if result:
-                    genre_id = result['id']
+            genre_id = self.get_genre_id(anime_data.get('genre'))
+
+            poster_hash = self._store_anime_poster(cursor, anime_data)
 
             # Вставляем аниме
-            cursor.execute('''
-                INSERT INTO anime 
-                (title, studio, genre_id, type, status, start_date, finish_date, 
-                 rating, review, poster_image, total_episodes, watched_episodes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            cursor.execute(INSERT_ANIME_SQL, (
                 anime_data['title'],
                 anime_data.get('studio', ''),
                 genre_id,
@@ -101,34 +983,194 @@ class Database:
                 anime_data['finish_date'],
                 anime_data['rating'],
                 anime_data['review'],
-                anime_data.get('poster_image'),
+                poster_hash,
                 anime_data.get('total_episodes', 0),
-                anime_data.get('watched_episodes', 0)
+                anime_data.get('watched_episodes', 0),
+                normalize_title(anime_data['title'])
             ))
 
             anime_id = cursor.lastrowid
             conn.commit()
             return anime_id
 
+    @instrumented
+    def add_anime_many(self, records: Iterable[Dict[str, Any]], batch_size: int = 500,
+                       on_duplicate: str = 'add') -> Tuple[int, List[Tuple[int, str]]]:
+        """Добавляет много аниме пакетами (executemany, одна транзакция на пакет).
+
+        on_duplicate - что делать с записью, нормализованное название которой уже
+        есть в базе (см. DUPLICATE_MODES); дубликат ищется по индексу title_key.
+        Возвращает (количество добавленных или обновленных, [(номер записи, текст ошибки), ...]).
+        Пропущенные в режиме skip дубликаты попадают в список ошибок.
+        """
+        if on_duplicate not in DUPLICATE_MODES:
+            raise ValueError(f"Неизвестный режим дубликатов: {on_duplicate}")
+
+        conn = self.connect()
+        cursor = conn.cursor()
+        duplicate_sql = UPDATE_DUPLICATE_SQL if on_duplicate == 'update' else MERGE_DUPLICATE_SQL
+
+        written = 0
+        errors = []
+        inserts = []
+        updates = []
+        # Ключи записей текущего пакета, которые еще не записаны в базу
+        pending_keys = set()
+
+        def insert_params(anime_data, params):
+            # Постер сохраняется в той же транзакции, что и запись, которая на него ссылается
+            return params[:9] + (self._store_anime_poster(cursor, anime_data),) + params[10:]
+
+        def flush():
+            nonlocal written
+            if not inserts and not updates:
+                return
+            try:
+                cursor.executemany(INSERT_ANIME_SQL, [insert_params(data, params) for _, data, params in inserts])
+                cursor.executemany(duplicate_sql, [params for _, _, params in updates])
+                conn.commit()
+                written += len(inserts) + len(updates)
+            except (sqlite3.Error, OSError, ValueError):
+                # Пакет откатывается (вместе с его постерами) и записывается построчно,
+                # каждая запись в своей точке сохранения, чтобы найти ошибочные
+                conn.rollback()
+                rows = ([(i, INSERT_ANIME_SQL, data, p) for i, data, p in inserts] +
+                        [(i, duplicate_sql, None, p) for i, _, p in updates])
+                for index, sql, anime_data, params in rows:
+                    cursor.execute("SAVEPOINT anime_row")
+                    try:
+                        if anime_data is not None:
+                            params = insert_params(anime_data, params)
+                        cursor.execute(sql, params)
+                        written += 1
+                    except (sqlite3.Error, OSError, ValueError) as e:
+                        cursor.execute("ROLLBACK TO anime_row")
+                        errors.append((index, str(e)))
+                    cursor.execute("RELEASE anime_row")
+                conn.commit()
+            for _, anime_id, _ in updates:
+                self.record_cache.invalidate(anime_id)
+            inserts.clear()
+            updates.clear()
+            pending_keys.clear()
+
+        for index, anime_data in enumerate(records):
+            error = self._validate_anime(anime_data)
+            if error:
+                errors.append((index, error))
+                continue
+
+            title_key = normalize_title(anime_data['title'])
+            genre_id = self.get_genre_id(anime_data.get('genre'))
+
+            existing_id = None
+            if on_duplicate != 'add' and title_key:
+                # Дубликат внутри еще не записанного пакета станет виден после его записи
+                if title_key in pending_keys:
+                    flush()
+                existing_id = self.find_duplicate(anime_data['title'])
+
+            if existing_id is None:
+                inserts.append((index, anime_data, (
+                    anime_data['title'],
+                    anime_data.get('studio', ''),
+                    genre_id,
+                    anime_data.get('type') or 'TV Сериал',
+                    anime_data['status'],
+                    anime_data.get('start_date'),
+                    anime_data.get('finish_date'),
+                    anime_data.get('rating'),
+                    anime_data.get('review'),
+                    None,  # poster_hash - заполняется при записи пакета
+                    anime_data.get('total_episodes', 0),
+                    anime_data.get('watched_episodes', 0),
+                    title_key
+                )))
+                if title_key:
+                    pending_keys.add(title_key)
+            elif on_duplicate == 'skip':
+                errors.append((index, "Уже есть в коллекции"))
+                continue
+            elif on_duplicate == 'update':
+                updates.append((index, existing_id, (
+                    anime_data['title'],
+                    anime_data.get('studio', ''),
+                    genre_id,
+                    anime_data.get('type') or 'TV Сериал',
+                    anime_data['status'],
+                    anime_data.get('start_date'),
+                    anime_data.get('finish_date'),
+                    anime_data.get('rating'),
+                    anime_data.get('review'),
+                    anime_data.get('total_episodes', 0),
+                    anime_data.get('watched_episodes', 0),
+                    title_key,
+                    existing_id
+                )))
+            else:
+                updates.append((index, existing_id, (
+                    anime_data.get('studio'),
+                    genre_id,
+                    anime_data.get('type'),
+                    anime_data.get('start_date'),
+                    anime_data.get('finish_date'),
+                    anime_data.get('rating'),
+                    anime_data.get('review'),
+                    anime_data.get('total_episodes', 0),
+                    anime_data.get('watched_episodes', 0),
+                    existing_id
+                )))
+
+            if len(inserts) + len(updates) >= batch_size:
+                flush()
+
+        flush()
+        return written, errors
+
+    def find_duplicate(self, title: str, exclude_id: Optional[int] = None) -> Optional[int]:
+        """Возвращает ID аниме с таким же нормализованным названием или None"""
+        title_key = normalize_title(title)
+        if not title_key:
+            return None
+        cursor = self.connect().cursor()
+        cursor.execute(
+            "SELECT id FROM anime WHERE title_key = ? AND id IS NOT ? ORDER BY id LIMIT 1",
+            (title_key, exclude_id)
+        )
+        row = cursor.fetchone()
+        return row['id'] if row else None
+
+    @staticmethod
+    def _validate_anime(anime_data: Dict[str, Any]) -> Optional[str]:
+        """Проверяет запись перед вставкой, возвращает текст ошибки или None"""
+        if not (anime_data.get('title') or '').strip():
+            return "Отсутствует название"
+        if anime_data.get('status') not in ANIME_STATUSES:
+            return f"Недопустимый статус: {anime_data.get('status')}"
+        if anime_data.get('type') and anime_data['type'] not in ANIME_TYPES:
+            return f"Недопустимый тип: {anime_data['type']}"
+        rating = anime_data.get('rating')
+        if rating is not None and not (isinstance(rating, int) and 1 <= rating <= 10):
+            return f"Недопустимая оценка: {rating}"
+        return None
+
+    @instrumented
     def update_anime(self, anime_id: int, anime_data: Dict[str, Any]) -> bool:
         """Обновляет данные аниме"""
         with self.connect() as conn:
             cursor = conn.cursor()
 
             # Получаем ID жанра по имени
-            genre_id = None
-            if anime_data.get('genre'):
-                cursor.execute("SELECT id FROM genres WHERE name = ?", (anime_data['genre'],))
-                result = cursor.fetchone()
-                if result:
-                    genre_id = result['id']
+            genre_id = self.get_genre_id(anime_data.get('genre'))
+
+            poster_hash = self._store_anime_poster(cursor, anime_data)
 
             cursor.execute('''
                 UPDATE anime 
                 SET title = ?, studio = ?, genre_id = ?, type = ?, status = ?, 
                     start_date = ?, finish_date = ?, rating = ?, review = ?,
-                    poster_image = ?, total_episodes = ?, watched_episodes = ?, 
-                    updated_at = CURRENT_TIMESTAMP
+                    poster_hash = ?, total_episodes = ?, watched_episodes = ?, 
+                    title_key = ?, updated_at = CURRENT_TIMESTAMP
                 WHERE id = ?
             ''', (
                 anime_data['title'],
@@ -140,187 +1182,402 @@ class Database:
                 anime_data['finish_date'],
                 anime_data['rating'],
                 anime_data['review'],
-                anime_data.get('poster_image'),
+                poster_hash,
                 anime_data.get('total_episodes', 0),
                 anime_data.get('watched_episodes', 0),
+                normalize_title(anime_data['title']),
                 anime_id
             ))
 
             conn.commit()
-            return cursor.rowcount > 0
+        self.record_cache.invalidate(anime_id)
+        return cursor.rowcount > 0
+
+    @instrumented
+    def patch_anime(self, anime_id: int, **fields) -> Optional[Dict[str, Any]]:
+        """Обновляет только переданные поля аниме (постер не затрагивается).
+
+        Возвращает новую версию записи (без постера) или None, если аниме не найдено.
+        """
+        unknown = set(fields) - set(PATCHABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Нельзя изменить поля: {', '.join(sorted(unknown))}")
 
+        if 'genre' in fields:
+            fields['genre_id'] = self.get_genre_id(fields.pop('genre'))
+        if 'title' in fields:
+            fields['title_key'] = normalize_title(fields['title'])
+
+        if fields:
+            assignments = ", ".join(f"{column} = ?" for column in fields)
+            # Строка не перезаписывается, если значения не изменились
+            changed = " OR ".join(f"{column} IS NOT ?" for column in fields)
+            values = list(fields.values())
+
+            with self.connect() as conn:
+                conn.execute(f'''
+                    UPDATE anime
+                    SET {assignments}, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND ({changed})
+                ''', values + [anime_id] + values)
+            self.record_cache.invalidate(anime_id)
+
+        return self.get_anime_summary(anime_id)
+
+    @instrumented
     def delete_anime(self, anime_id: int) -> bool:
         """Удаляет аниме из базы данных"""
         with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM anime WHERE id = ?", (anime_id,))
             conn.commit()
-            return cursor.rowcount > 0
+        self.record_cache.invalidate(anime_id)
+        return cursor.rowcount > 0
 
+    @instrumented
     def get_anime(self, anime_id: int) -> Optional[Dict[str, Any]]:
-        """Получает информацию об аниме по ID"""
+        """Получает информацию об аниме по ID (повторные запросы обслуживаются из кэша)"""
+        anime = self.record_cache.get(anime_id)
+        if anime is not None:
+            return anime
+
+        generation = self.record_cache.generation
         with self.connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT a.*, g.name as genre_name 
+            cursor.execute(f'''
+                SELECT {ANIME_DETAIL_COLUMNS}
                 FROM anime a
                 LEFT JOIN genres g ON a.genre_id = g.id
+                LEFT JOIN posters p ON a.poster_hash = p.hash
                 WHERE a.id = ?
             ''', (anime_id,))
 
             row = cursor.fetchone()
             if row:
-                return dict(row)
+                anime = dict(row)
+                self.record_cache.put(anime_id, anime, generation)
+                return anime
             return None
 
+    @instrumented
+    def get_anime_summary(self, anime_id: int) -> Optional[Dict[str, Any]]:
+        """Получает запись аниме по ID без постера (колонки списка и updated_at)"""
+        cursor = self.connect().cursor()
+        cursor.execute(f'''
+            SELECT {ANIME_LIST_COLUMNS}, a.updated_at
+            FROM anime a
+            LEFT JOIN genres g ON a.genre_id = g.id
+            WHERE a.id = ?
+        ''', (anime_id,))
+
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+    @instrumented
     def get_all_anime(self, search_text: str = "") -> List[Dict[str, Any]]:
         """Получает список всех аниме с возможностью поиска"""
         with self.connect() as conn:
             cursor = conn.cursor()
 
-            if search_text:
-                search_pattern = f"%{search_text}%"
-                cursor.execute('''
-                    SELECT a.*, g.name as genre_name 
-                    FROM anime a
-                    LEFT JOIN genres g ON a.genre_id = g.id
-                    WHERE a.title LIKE ? OR a.studio LIKE ?
-                    ORDER BY a.created_at DESC
-                ''', (search_pattern, search_pattern))
-            else:
-                cursor.execute('''
-                    SELECT a.*, g.name as genre_name 
-                    FROM anime a
-                    LEFT JOIN genres g ON a.genre_id = g.id
-                    ORDER BY a.created_at DESC
-                ''')
+            join, where, params, order_by = self._search_filter(search_text)
+            cursor.execute(f'''
+                SELECT {ANIME_DETAIL_COLUMNS}
+                FROM anime a
+                {join}
+                LEFT JOIN genres g ON a.genre_id = g.id
+                LEFT JOIN posters p ON a.poster_hash = p.hash
+                {where}
+                ORDER BY {order_by}
+            ''', params)
 
             return [dict(row) for row in cursor.fetchall()]
 
-    def get_all_genres(self) -> List[Dict[str, Any]]:
-        """Получает список всех жанров"""
+    @instrumented
+    def get_anime_list(self, search_text: str = "") -> List[Dict[str, Any]]:
+        """Получает список аниме для таблицы (без постеров, с флагом has_poster)"""
         with self.connect() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM genres ORDER BY name")
+
+            join, where, params, order_by = self._search_filter(search_text)
+            cursor.execute(f'''
+                SELECT {ANIME_LIST_COLUMNS}
+                FROM anime a
+                {join}
+                LEFT JOIN genres g ON a.genre_id = g.id
+                {where}
+                ORDER BY {order_by}
+            ''', params)
             return [dict(row) for row in cursor.fetchall()]
 
-    def get_statistics(self) -> Dict[str, Any]:
-        """Получает статистику по аниме"""
+    @instrumented
+    def get_anime_page(self, search_text: str = "", status: Optional[str] = None,
+                       genre: Optional[str] = None, anime_type: Optional[str] = None,
+                       after: Optional[Tuple[str, int]] = None,
+                       page_size: int = 200) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, int]]]:
+        """Получает страницу списка аниме (новые сверху) с поиском и фильтрами.
+
+        after - курсор (created_at, id) последней записи предыдущей страницы.
+        Возвращает (записи, курсор следующей страницы или None).
+        """
+        conditions = []
+        params = []
+
+        if search_text:
+            fts_query = self._fts_query(search_text) if self.fts_enabled else ""
+            if fts_query:
+                conditions.append("a.id IN (SELECT rowid FROM anime_fts WHERE anime_fts MATCH ?)")
+                params.append(fts_query)
+            else:
+                search_pattern = f"%{search_text}%"
+                conditions.append("(a.title LIKE ? OR a.studio LIKE ?)")
+                params.extend([search_pattern, search_pattern])
+
+        if status:
+            conditions.append("a.status = ?")
+            params.append(status)
+
+        if genre:
+            conditions.append("a.genre_id = ?")
+            params.append(self.get_genre_id(genre))
+
+        if anime_type:
+            conditions.append("a.type = ?")
+            params.append(anime_type)
+
+        if after:
+            conditions.append("(a.created_at, a.id) < (?, ?)")
+            params.extend(after)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(page_size)
+
         with self.connect() as conn:
             cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {ANIME_LIST_COLUMNS}
+                FROM anime a
+                LEFT JOIN genres g ON a.genre_id = g.id
+                {where}
+                ORDER BY a.created_at DESC, a.id DESC
+                LIMIT ?
+            ''', params)
+            rows = [dict(row) for row in cursor.fetchall()]
 
-            # Общая статистика
-            cursor.execute("SELECT COUNT(*) as total FROM anime")
-            total = cursor.fetchone()['total']
-
-            cursor.execute("SELECT COUNT(*) as watched_count FROM anime WHERE status = 'Просмотрено'")
-            watched_count = cursor.fetchone()['watched_count']
+        next_cursor = None
+        if len(rows) == page_size:
+            next_cursor = (rows[-1]['created_at'], rows[-1]['id'])
+        return rows, next_cursor
 
-            cursor.execute("SELECT COUNT(*) as watching_count FROM anime WHERE status = 'Смотрю'")
-            watching_count = cursor.fetchone()['watching_count']
+    @instrumented
+    def count_anime(self) -> int:
+        """Возвращает количество аниме в коллекции (из сводной статистики)"""
+        cursor = self.connect().cursor()
+        cursor.execute("SELECT count FROM anime_stats WHERE dimension = 'total'")
+        row = cursor.fetchone()
+        return row['count'] if row else 0
 
-            cursor.execute("SELECT COUNT(*) as planned_count FROM anime WHERE status = 'Запланировано'")
-            planned_count = cursor.fetchone()['planned_count']
+    @instrumented
+    def get_all_genres(self) -> List[Dict[str, Any]]:
+        """Получает список всех жанров (из кэша)"""
+        return [dict(genre) for genre in self._load_genres()]
 
-            cursor.execute("SELECT COUNT(*) as dropped_count FROM anime WHERE status = 'Брошено'")
-            dropped_count = cursor.fetchone()['dropped_count']
+    def get_genre_id(self, name: Optional[str]) -> Optional[int]:
+        """Возвращает ID жанра по имени (из кэша)"""
+        if not name:
+            return None
+        self._load_genres()
+        return self._genre_ids.get(name)
 
-            cursor.execute("SELECT AVG(rating) as avg_rating FROM anime WHERE rating IS NOT NULL")
-            avg_rating = cursor.fetchone()['avg_rating'] or 0
+    def get_genre_name(self, genre_id: Optional[int]) -> Optional[str]:
+        """Возвращает имя жанра по ID (из кэша)"""
+        if genre_id is None:
+            return None
+        self._load_genres()
+        return self._genre_names.get(genre_id)
 
-            cursor.execute("SELECT SUM(total_episodes) as total_episodes FROM anime WHERE total_episodes > 0")
-            total_episodes = cursor.fetchone()['total_episodes'] or 0
+    def invalidate_genre_cache(self):
+        """Сбрасывает кэш жанров - вызывается после любых изменений таблицы genres"""
+        with self._genres_lock:
+            self._genres = None
 
-            cursor.execute("SELECT SUM(watched_episodes) as watched_episodes FROM anime WHERE watched_episodes > 0")
-            watched_episodes = cursor.fetchone()['watched_episodes'] or 0
+    def _load_genres(self) -> List[Dict[str, Any]]:
+        """Загружает справочник жанров один раз и держит его в памяти"""
+        with self._genres_lock:
+            if self._genres is None:
+                cursor = self.connect().cursor()
+                cursor.execute("SELECT * FROM genres ORDER BY name")
+                genres = [dict(row) for row in cursor.fetchall()]
+                self._genre_ids = {genre['name']: genre['id'] for genre in genres}
+                self._genre_names = {genre['id']: genre['name'] for genre in genres}
+                self._genres = genres
+            return self._genres
 
-            # Статистика по жанрам
+    @instrumented
+    def get_statistics(self) -> Dict[str, Any]:
+        """Получает статистику по аниме из сводной таблицы (за O(число групп))"""
+        with self.connect() as conn:
+            cursor = conn.cursor()
             cursor.execute('''
-                SELECT g.name as genre, COUNT(a.id) as count
-                FROM genres g
-                LEFT JOIN anime a ON g.id = a.genre_id
-                GROUP BY g.name
-                HAVING COUNT(a.id) > 0
-                ORDER BY count DESC
+                SELECT s.*, g.name AS genre_name
+                FROM anime_stats s
+                LEFT JOIN genres g ON s.dimension = 'genre' AND g.id = s.key
+                WHERE s.count > 0
             ''')
-            genres_stats = [dict(row) for row in cursor.fetchall()]
 
-            # Статистика по оценкам
-            cursor.execute('''
-                SELECT rating, COUNT(*) as count
-                FROM anime
-                WHERE rating IS NOT NULL
-                GROUP BY rating
-                ORDER BY rating
-            ''')
-            ratings_stats = [dict(row) for row in cursor.fetchall()]
+            groups = {dimension: [] for dimension in STATS_DIMENSIONS}
+            for row in cursor.fetchall():
+                groups[row['dimension']].append(dict(row))
 
-            # Статистика по типам
-            cursor.execute('''
-                SELECT type, COUNT(*) as count
-                FROM anime
-                WHERE type IS NOT NULL
-                GROUP BY type
-                ORDER BY count DESC
-            ''')
-            types_stats = [dict(row) for row in cursor.fetchall()]
+        totals = groups['total'][0] if groups['total'] else dict.fromkeys(STATS_MEASURES, 0)
+        status_counts = {row['key']: row['count'] for row in groups['status']}
+        avg_rating = totals['rating_sum'] / totals['rating_count'] if totals['rating_count'] else 0
+
+        def by_count(rows, name):
+            rows = sorted(rows, key=lambda row: row['count'], reverse=True)
+            return [{name: row['key'], 'count': row['count']} for row in rows]
+
+        def by_key(rows, name):
+            rows = sorted(rows, key=lambda row: row['key'])
+            return [{name: row['key'], 'count': row['count']} for row in rows]
+
+        genres_stats = sorted(
+            ({'genre': row['genre_name'], 'count': row['count']} for row in groups['genre'] if row['genre_name']),
+            key=lambda item: item['count'], reverse=True
+        )
+
+        return {
+            'total': totals['count'],
+            'watched_count': status_counts.get('Просмотрено', 0),
+            'watching_count': status_counts.get('Смотрю', 0),
+            'planned_count': status_counts.get('Запланировано', 0),
+            'on_hold_count': status_counts.get('Отложено', 0),
+            'dropped_count': status_counts.get('Брошено', 0),
+            'avg_rating': round(avg_rating, 2) if avg_rating else 0,
+            'total_episodes': totals['total_episodes'],
+            'watched_episodes': totals['watched_episodes'],
+            'genres_stats': genres_stats,
+            'ratings_stats': by_key(groups['rating'], 'rating'),
+            'types_stats': by_count(groups['type'], 'type'),
+            'monthly_stats': by_key(groups['month'], 'month'),
+            'yearly_stats': by_key(groups['year'], 'year')
+        }
+
+    def revision(self) -> Tuple[str, int]:
+        """Ревизия данных: (идентификатор базы, счетчик изменений аниме и жанров).
+
+        Ревизия хранится в самой базе: она одна для всех потоков и процессов
+        и сохраняется между запусками.
+        """
+        cursor = self.connect().execute("SELECT key, value FROM meta WHERE key IN ('instance', 'revision')")
+        meta = dict(cursor.fetchall())
+        return meta['instance'], meta['revision']
 
-            # Аниме по годам (для статистики "в этом году")
+    def cached_statistics(self) -> Optional[Dict[str, Any]]:
+        """Сохраненная статистика, если с тех пор данные не менялись, иначе None (один запрос к meta)"""
+        with self._statistics_cache_lock:
+            if not self._statistics_cache_loaded:
+                self._statistics_cache = self._load_statistics_cache()
+                self._statistics_cache_loaded = True
+            cached = self._statistics_cache
+
+        if cached is None or cached[0] != list(self.revision()):
+            return None
+        return json.loads(cached[1])
+
+    def get_statistics_cached(self) -> Dict[str, Any]:
+        """Статистика из кэша, а если данные изменились - пересчитанная и сохраненная в кэш"""
+        stats = self.cached_statistics()
+        if stats is not None:
+            return stats
+
+        revision = self.revision()
+        stats = self.get_statistics()
+        # Данные изменились во время подсчета - результат может не соответствовать ревизии
+        if self.revision() == revision:
+            self._store_statistics_cache(list(revision), stats)
+        return stats
+
+    def _load_statistics_cache(self) -> Optional[Tuple[List, str]]:
+        """Читает кэш статистики с диска: (ревизия, статистика в JSON) или None"""
+        if not self.statistics_cache_path or not os.path.exists(self.statistics_cache_path):
+            return None
+        try:
+            with open(self.statistics_cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data['revision'], json.dumps(data['statistics'], ensure_ascii=False)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error reading statistics cache: {e}")
+            return None
+
+    def _store_statistics_cache(self, revision: List, stats: Dict[str, Any]):
+        """Запоминает статистику в памяти и на диске (запись через временный файл)"""
+        # Статистика хранится сериализованной, чтобы вызывающий код не мог изменить кэш
+        serialized = json.dumps(stats, ensure_ascii=False)
+        with self._statistics_cache_lock:
+            self._statistics_cache = (revision, serialized)
+            self._statistics_cache_loaded = True
+            if not self.statistics_cache_path:
+                return
+
+            temp_path = f"{self.statistics_cache_path}.tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(f'{{"revision": {json.dumps(revision)}, "statistics": {serialized}}}')
+                os.replace(temp_path, self.statistics_cache_path)
+            except OSError as e:
+                print(f"Error saving statistics cache: {e}")
+
+    @instrumented
+    def export_to_csv(self, file_path: str, progress=None, chunk_size: int = 500) -> bool:
+        """Экспортирует данные в CSV файл, читая записи порциями (без постеров).
+
+        progress(экспортировано, всего) вызывается после каждой порции;
+        если он возвращает False, экспорт прерывается и файл удаляется.
+        """
+        import csv
+        total = self.count_anime()
+        exported = 0
+        completed = False
+        try:
+            cursor = self.connect().cursor()
             cursor.execute('''
-                SELECT strftime('%Y', finish_date) as year, COUNT(*) as count
-                FROM anime
-                WHERE finish_date IS NOT NULL
-                GROUP BY strftime('%Y', finish_date)
-                ORDER BY year
+                SELECT a.id, a.title, a.studio, g.name AS genre_name, a.type, a.status,
+                       a.start_date, a.finish_date, a.rating, a.total_episodes,
+                       a.watched_episodes, a.review
+                FROM anime a
+                LEFT JOIN genres g ON a.genre_id = g.id
+                ORDER BY a.created_at DESC, a.id DESC
             ''')
-            yearly_stats = [dict(row) for row in cursor.fetchall()]
-
-            return {
-                'total': total,
-                'watched_count': watched_count,
-                'watching_count': watching_count,
-                'planned_count': planned_count,
-                'dropped_count': dropped_count,
-                'avg_rating': round(avg_rating, 2) if avg_rating else 0,
-                'total_episodes': total_episodes,
-                'watched_episodes': watched_episodes,
-                'genres_stats': genres_stats,
-                'ratings_stats': ratings_stats,
-                'types_stats': types_stats,
-                'monthly_stats': monthly_stats,
-                'yearly_stats': yearly_stats  # Добавлено
-            }
-
-    def export_to_csv(self, file_path: str) -> bool:
-        """Экспортирует данные в CSV файл"""
-        try:
-            import csv
-            anime_list = self.get_all_anime()
 
             with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['id', 'title', 'studio', 'genre', 'type', 'status',
-                              'start_date', 'finish_date', 'rating', 'total_episodes',
-                              'watched_episodes', 'review']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-                writer.writeheader()
-                for anime in anime_list:
-                    writer.writerow({
-                        'id': anime['id'],
-                        'title': anime['title'],
-                        'studio': anime['studio'] or '',
-                        'genre': anime.get('genre_name', ''),
-                        'type': anime['type'],
-                        'status': anime['status'],
-                        'start_date': anime['start_date'],
-                        'finish_date': anime['finish_date'],
-                        'rating': anime['rating'] or '',
-                        'total_episodes': anime['total_episodes'] or 0,
-                        'watched_episodes': anime['watched_episodes'] or 0,
-                        'review': anime['review'] or ''
-                    })
-
-            return True
+                writer = csv.writer(csvfile)
+                writer.writerow(['id', 'title', 'studio', 'genre', 'type', 'status',
+                                 'start_date', 'finish_date', 'rating', 'total_episodes',
+                                 'watched_episodes', 'review'])
+
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        completed = True
+                        break
+                    writer.writerows(
+                        (anime['id'], anime['title'], anime['studio'] or '',
+                         anime['genre_name'] or '', anime['type'], anime['status'],
+                         anime['start_date'], anime['finish_date'], anime['rating'] or '',
+                         anime['total_episodes'] or 0, anime['watched_episodes'] or 0,
+                         anime['review'] or '')
+                        for anime in rows
+                    )
+                    exported += len(rows)
+                    if progress and progress(exported, max(total, exported)) is False:
+                        break
+            cursor.close()
         except Exception as e:
             print(f"Error exporting to CSV: {e}")
-            return False
\ No newline at end of file
+
+        if not completed:
+            # Экспорт отменен или прерван ошибкой - не оставляем недописанный файл
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            return False
+        return True
@@ -0,0 +1,94 @@
+import queue
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Union
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+
+class DatabaseWorker(QThread):
+    """Фоновый поток для запросов к базе: выполняет их по очереди и возвращает результат в GUI.
+
+    Поток работает со своим соединением (Database держит по соединению на поток).
+    submit() вызывается из GUI-потока и возвращает Future; callback/errback
+    вызываются в GUI-потоке. Запросы с одинаковым ключом схлопываются: еще не
+    начатый старый запрос отменяется, а результат уже выполняющегося не доставляется.
+    """
+
+    # key, future, callback, errback - передаются в GUI-поток через очередь событий Qt
+    result_ready = pyqtSignal(object, object, object, object)
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._queue = queue.Queue()
+        # Последний запрос для каждого ключа (используется только из GUI-потока)
+        self._latest: Dict[str, Future] = {}
+        self.result_ready.connect(self._deliver)
+
+    def submit(self, key: Optional[str], fn: Union[str, Callable], *args,
+               callback: Optional[Callable[[Any], None]] = None,
+               errback: Optional[Callable[[Exception], None]] = None, **kwargs) -> Future:
+        """Ставит вызов fn(*args, **kwargs) в очередь потока базы данных.
+
+        fn - имя метода Database или функция, которая сама обращается к базе.
+        key - ключ для схлопывания ('list', 'details', ...); None - не схлопывать.
+        """
+        if isinstance(fn, str):
+            fn = getattr(self.db, fn)
+
+        future = Future()
+        if key is not None:
+            previous = self._latest.get(key)
+            if previous is not None:
+                previous.cancel()
+            self._latest[key] = future
+
+        self._queue.put((key, future, fn, args, kwargs, callback, errback))
+        return future
+
+    def cancel(self, key: str):
+        """Отменяет последний запрос с ключом key: его результат не будет доставлен"""
+        future = self._latest.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def busy(self) -> bool:
+        """Есть ли запросы, результат которых еще не доставлен (вызывается из GUI-потока)"""
+        return bool(self._latest) or not self._queue.empty()
+
+    def run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            key, future, fn, args, kwargs, callback, errback = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            self.result_ready.emit(key, future, callback, errback)
+
+    def _deliver(self, key: Optional[str], future: Future, callback, errback):
+        """Передает результат в GUI-поток, если за это время не пришел более новый запрос с тем же ключом"""
+        if key is not None:
+            if self._latest.get(key) is not future:
+                return
+            del self._latest[key]
+
+        error = future.exception()
+        if error is not None:
+            if errback:
+                errback(error)
+            else:
+                print(f"Database worker error: {error}")
+        elif callback:
+            callback(future.result())
+
+    def stop(self):
+        """Останавливает поток после уже поставленных в очередь запросов"""
+        self._queue.put(None)
+        self.wait()
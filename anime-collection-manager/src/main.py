@@ -1,19 +1,82 @@
 import sys
 import os
-from PyQt6.QtWidgets import QApplication
+import sqlite3
+from PyQt6.QtWidgets import QApplication, QProgressDialog
+from PyQt6.QtCore import Qt
 from main_window import MainWindow
 from database import Database
+from maintenance import DatabaseMaintenance
+
+
+def migrate_with_progress(db):
+    """Обновляет схему базы, показывая прогресс (на актуальной базе окно не появляется)"""
+    steps = db.pending_migrations()
+    if not steps:
+        return
+
+    dialog = QProgressDialog("Обновление базы данных...", None, 0, len(db.MIGRATIONS))
+    dialog.setWindowTitle("Аниме-менеджер")
+    dialog.setWindowModality(Qt.WindowModality.ApplicationModal)
+    dialog.setMinimumDuration(0)
+    dialog.setValue(len(db.MIGRATIONS) - steps)
+
+    def progress(step, total, message):
+        dialog.setLabelText(f"Обновление базы данных (шаг {step} из {total})\n{message}")
+        dialog.setValue(step - 1)
+        QApplication.processEvents()
+
+    db.init_db(progress)
+    dialog.setValue(len(db.MIGRATIONS))
+    dialog.close()
 
 
 def main():
+    # Служебные команды: перестроить поисковый индекс или сводную статистику без запуска интерфейса
+    if "--rebuild-search-index" in sys.argv:
+        db = Database()
+        db.init_db()
+        db.rebuild_search_index()
+        db.close()
+        print("Search index rebuilt")
+        return
+
+    if "--vacuum" in sys.argv:
+        db = Database()
+        db.init_db()
+        maintenance = DatabaseMaintenance(db)
+        try:
+            freed = maintenance.compact()
+            print(f"Database compacted, pages freed: {freed}")
+        except sqlite3.Error as e:
+            # Например, не хватило места на диске для VACUUM или база занята другим процессом
+            print(f"Error compacting database: {e}")
+        print(maintenance.report_text())
+        db.close()
+        return
+
+    if "--check-statistics" in sys.argv:
+        db = Database()
+        db.init_db()
+        if db.check_statistics():
+            print("Statistics summary is consistent")
+        else:
+            db.rebuild_statistics()
+            print("Statistics summary was inconsistent and has been rebuilt")
+        db.close()
+        return
+
     app = QApplication(sys.argv)
     app.setApplicationName("Аниме-менеджер")
 
     # Устанавливаем стиль
     app.setStyle("Fusion")
 
-    db = Database()
-    db.init_db()
+    # Лог медленных запросов: путь и порог (мс) можно переопределить переменными окружения
+    db = Database(
+        slow_query_ms=float(os.environ.get("ANIME_SLOW_QUERY_MS", "100")),
+        slow_log_path=os.environ.get("ANIME_SLOW_QUERY_LOG", "slow_queries.log")
+    )
+    migrate_with_progress(db)
 
     window = MainWindow(db)
     window.show()
@@ -1,21 +1,48 @@
 import os
 from PyQt6.QtWidgets import (
     QMainWindow, QMessageBox, QFileDialog, QInputDialog,
-    QTableWidgetItem, QMenu, QHeaderView
+    QTableWidgetItem, QMenu, QHeaderView, QProgressDialog, QApplication
 )
-from PyQt6.QtCore import Qt, QDate
+from PyQt6.QtCore import Qt, QDate, QTimer
 from PyQt6.QtGui import QAction, QPixmap, QShortcut, QKeySequence
 from PyQt6 import uic
 from add_anime_dialog import AddAnimeDialog
 from statistics_dialog import StatisticsDialog
+from csv_import import CsvImporter
+from db_worker import DatabaseWorker
+from maintenance import DatabaseMaintenance
 import csv
+import sqlite3
 
 
 class MainWindow(QMainWindow):
+    # Сколько записей подгружается в таблицу за один раз
+    PAGE_SIZE = 200
+
+    # Как часто проверять, не изменил ли базу другой процесс (мс)
+    CHANGE_POLL_INTERVAL = 2000
+
+    # Как часто выполнять шаг обслуживания базы в простое (мс)
+    MAINTENANCE_INTERVAL = 30000
+
     def __init__(self, db):
         super().__init__()
         self.db = db
         self.current_anime_id = None
+        self.next_page_cursor = None
+        # Поиск и токен изменений базы, для которых загружен текущий список
+        self.list_key = None
+
+        # Чтение списка, деталей и статистики идет в фоновом потоке, чтобы окно не зависало
+        self.db_async = DatabaseWorker(db, self)
+        self.db_async.start()
+
+        # Снимок коллекции для аналитики: создается при первом открытии статистики,
+        # дальше обновляется только измененными записями (используется в фоновом потоке)
+        self.snapshot = None
+
+        # Обслуживание базы (очистка свободных страниц, статистика планировщика) - в фоновом потоке
+        self.maintenance = DatabaseMaintenance(db)
 
         # Загружаем интерфейс из файла .ui
         ui_path = os.path.join(os.path.dirname(__file__), '..', 'qt', 'main_window.ui')
@@ -25,6 +52,17 @@ class MainWindow(QMainWindow):
         self.setup_signals()
         self.load_anime()
 
+        # Изменения, сделанные другим процессом с той же базой, подхватываются по таймеру;
+        # проверка стоит двух коротких запросов, список перезагружается только если данные изменились
+        self.change_timer = QTimer(self)
+        self.change_timer.timeout.connect(self.load_anime)
+        self.change_timer.start(self.CHANGE_POLL_INTERVAL)
+
+        # Свободные страницы возвращаются файловой системе небольшими шагами, пока нет других запросов
+        self.maintenance_timer = QTimer(self)
+        self.maintenance_timer.timeout.connect(self.run_maintenance_step)
+        self.maintenance_timer.start(self.MAINTENANCE_INTERVAL)
+
     def setup_ui(self):
         """Настраивает интерфейс"""
         # Настраиваем таблицу аниме
@@ -65,6 +103,7 @@ class MainWindow(QMainWindow):
         self.search_input.textChanged.connect(self.load_anime)
 
         # Таблица
+        self.table_anime.verticalScrollBar().valueChanged.connect(self.on_table_scrolled)
         self.table_anime.currentCellChanged.connect(self.on_anime_selected)
         self.table_anime.customContextMenuRequested.connect(self.show_context_menu)
         self.table_anime.doubleClicked.connect(self.edit_anime)
@@ -76,6 +115,8 @@ class MainWindow(QMainWindow):
         self.action_export.triggered.connect(self.export_data)
         self.action_import.triggered.connect(self.import_data)
         self.action_stats.triggered.connect(self.show_statistics)
+        self.action_query_stats.triggered.connect(self.show_query_stats)
+        self.action_db_maintenance.triggered.connect(self.show_db_maintenance)
         self.action_about.triggered.connect(self.show_about)
         self.action_exit.triggered.connect(self.close)
 
@@ -98,13 +139,81 @@ class MainWindow(QMainWindow):
         self.search_input.selectAll()
 
     def load_anime(self):
-        """Загружает список аниме в таблицу"""
+        """Загружает список аниме в таблицу (запрос выполняется в фоновом потоке)"""
         search_text = self.search_input.text().strip()
-        anime_list = self.db.get_all_anime(search_text)
 
-        self.table_anime.setRowCount(len(anime_list))
+        # Ни поиск, ни данные не изменились - таблица уже актуальна
+        list_key = (search_text, self.db.change_token())
+        if list_key == self.list_key:
+            return
+        self.list_key = list_key
+
+        # Подгрузка страниц старого списка больше не нужна
+        self.next_page_cursor = None
+        self.db_async.cancel('page')
+
+        if search_text:
+            # Результаты поиска ранжированы по релевантности и приходят целиком;
+            # если точных совпадений нет, ищем похожие названия (опечатки)
+            def load():
+                anime_list = self.db.get_anime_list(search_text)
+                if anime_list:
+                    return anime_list, None, None, False
+                return self.db.search_fuzzy(search_text), None, None, True
+        else:
+            # Без поиска коллекция подгружается постранично
+            def load():
+                anime_list, next_cursor = self.db.get_anime_page(page_size=self.PAGE_SIZE)
+                return anime_list, next_cursor, self.db.count_anime(), False
+
+        # Более ранний запрос списка (например, по предыдущей букве поиска) схлопывается
+        self.db_async.submit('list', load, callback=lambda result: self.show_anime_list(search_text, *result))
+
+    def show_anime_list(self, search_text, anime_list, next_cursor, total, fuzzy):
+        """Заполняет таблицу результатами поиска или первой страницей списка"""
+        self.table_anime.setRowCount(0)
+        self.next_page_cursor = next_cursor
+        self.append_anime_rows(anime_list)
 
-        for row, anime in enumerate(anime_list):
+        # Обновляем статус бар
+        if search_text and fuzzy and anime_list:
+            self.statusbar.showMessage(
+                f"Точных совпадений нет, похожие названия: {len(anime_list)} (поиск: '{search_text}')", 5000
+            )
+        elif search_text:
+            self.statusbar.showMessage(f"Найдено аниме: {len(anime_list)} (поиск: '{search_text}')", 5000)
+        else:
+            self.statusbar.showMessage(f"Всего аниме: {total}")
+
+    def load_next_page(self):
+        """Подгружает следующую страницу списка аниме"""
+        if not self.next_page_cursor:
+            return
+
+        # Пока страница загружается, повторные прокрутки не ставят новых запросов
+        after, self.next_page_cursor = self.next_page_cursor, None
+        self.db_async.submit(
+            'page', 'get_anime_page', after=after, page_size=self.PAGE_SIZE,
+            callback=lambda result: self.show_next_page(*result)
+        )
+
+    def show_next_page(self, anime_list, next_cursor):
+        """Добавляет загруженную страницу в конец таблицы"""
+        self.next_page_cursor = next_cursor
+        self.append_anime_rows(anime_list)
+
+    def on_table_scrolled(self, value):
+        """Подгружает следующую страницу, когда таблицу прокрутили почти до конца"""
+        scrollbar = self.table_anime.verticalScrollBar()
+        if self.next_page_cursor and value >= scrollbar.maximum() - scrollbar.pageStep():
+            self.load_next_page()
+
+    def append_anime_rows(self, anime_list):
+        """Добавляет записи аниме в конец таблицы"""
+        first_row = self.table_anime.rowCount()
+        self.table_anime.setRowCount(first_row + len(anime_list))
+
+        for row, anime in enumerate(anime_list, start=first_row):
             # ID
             self.table_anime.setItem(row, 0, QTableWidgetItem(str(anime['id'])))
 
@@ -208,13 +317,6 @@ class MainWindow(QMainWindow):
 
             self.table_anime.setItem(row, 9, episodes_item)
 
-        # Обновляем статус бар
-        total_count = len(anime_list)
-        if search_text:
-            self.statusbar.showMessage(f"Найдено аниме: {total_count} (поиск: '{search_text}')", 5000)
-        else:
-            self.statusbar.showMessage(f"Всего аниме: {total_count}")
-
     def on_anime_selected(self, current_row, current_column, previous_row, previous_column):
         """Обрабатывает выбор аниме в таблице"""
         if current_row < 0:  # Если строка не выбрана
@@ -227,9 +329,12 @@ class MainWindow(QMainWindow):
         anime_id = int(anime_id_item.text())
         self.current_anime_id = anime_id
 
-        # Загружаем детальную информацию
-        anime = self.db.get_anime(anime_id)
-        if anime:
+        # Загружаем детальную информацию (при быстром переборе строк доставляется только последняя)
+        self.db_async.submit('details', 'get_anime', anime_id, callback=self.on_anime_details_loaded)
+
+    def on_anime_details_loaded(self, anime):
+        """Показывает загруженные детали, если выбранное аниме не сменилось"""
+        if anime and anime['id'] == self.current_anime_id:
             self.show_anime_details(anime)
 
     def show_anime_details(self, anime):
@@ -326,8 +431,86 @@ class MainWindow(QMainWindow):
 
     def show_statistics(self):
         """Показывает диалог статистики"""
-        dialog = StatisticsDialog(self.db, self)
+        if self.snapshot is None:
+            # NumPy нужен только вкладке аналитики - без него остальная статистика работает
+            try:
+                from analytics import CollectionSnapshot
+                self.snapshot = CollectionSnapshot(self.db)
+            except ImportError as e:
+                print(f"Analytics is unavailable: {e}")
+
+        dialog = StatisticsDialog(self.db, self, db_async=self.db_async, snapshot=self.snapshot)
         dialog.exec()
+        # Диалог закрыт - его запросы, если они еще не выполнены, больше не нужны
+        self.db_async.cancel('statistics')
+        self.db_async.cancel('analytics')
+
+    def show_query_stats(self):
+        """Показывает счетчики запросов к базе данных"""
+        report = self.db.query_stats_report()
+
+        msg_box = QMessageBox(self)
+        msg_box.setWindowTitle("Статистика запросов")
+        msg_box.setText("Количество вызовов, время (всего, p50, p99), строки и байты "
+                        "по методам базы данных и SQL-запросам.")
+        msg_box.setDetailedText(report)
+        save_button = msg_box.addButton("Сохранить...", QMessageBox.ButtonRole.ActionRole)
+        reset_button = msg_box.addButton("Сбросить", QMessageBox.ButtonRole.ResetRole)
+        msg_box.addButton(QMessageBox.StandardButton.Close)
+        msg_box.exec()
+
+        if msg_box.clickedButton() == save_button:
+            file_path, _ = QFileDialog.getSaveFileName(
+                self, "Сохранить статистику запросов", "query_stats.txt", "Text Files (*.txt)"
+            )
+            if file_path:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(report)
+                self.statusbar.showMessage(f"✅ Статистика запросов сохранена в {file_path}", 3000)
+        elif msg_box.clickedButton() == reset_button:
+            self.db.query_stats.reset()
+            self.statusbar.showMessage("Счетчики запросов сброшены", 3000)
+
+    def run_maintenance_step(self):
+        """Ставит шаг обслуживания базы в фоновый поток, если тот ничем не занят"""
+        if not self.db_async.busy():
+            self.db_async.submit('maintenance', self.maintenance.run_step)
+
+    def show_db_maintenance(self):
+        """Показывает отчет о размере базы (dbstat читает весь файл, поэтому в фоновом потоке)"""
+        self.statusbar.showMessage("Подсчет размера базы...")
+        self.db_async.submit('maintenance_report', self.maintenance.report_text,
+                             callback=self.show_db_maintenance_report,
+                             errback=lambda e: QMessageBox.critical(
+                                 self, "Ошибка", f"Не удалось получить размер базы:\n{e}"))
+
+    def show_db_maintenance_report(self, report):
+        """Окно отчета о размере базы с кнопкой сжатия"""
+        self.statusbar.clearMessage()
+        msg_box = QMessageBox(self)
+        msg_box.setWindowTitle("Размер базы данных")
+        # Сводка - в тексте окна, размеры таблиц и индексов - в подробностях
+        summary, _, details = report.partition("\n\n")
+        msg_box.setText(summary)
+        if details:
+            msg_box.setDetailedText(details)
+        compact_button = msg_box.addButton("Сжать сейчас", QMessageBox.ButtonRole.ActionRole)
+        msg_box.addButton(QMessageBox.StandardButton.Close)
+        msg_box.exec()
+
+        if msg_box.clickedButton() == compact_button:
+            # Первое сжатие переводит базу на инкрементальную очистку (полный VACUUM)
+            self.statusbar.showMessage("Сжатие базы...")
+            self.db_async.submit('maintenance', self.maintenance.compact,
+                                 callback=lambda freed: self.statusbar.showMessage(
+                                     f"✅ База сжата, освобождено страниц: {freed}", 3000),
+                                 errback=self.show_compact_error)
+
+    def show_compact_error(self, error):
+        """Сообщает об ошибке сжатия базы (база остается в прежнем режиме)"""
+        self.statusbar.clearMessage()
+        print(f"Error compacting database: {error}")
+        QMessageBox.critical(self, "Ошибка", f"Не удалось сжать базу данных:\n{error}")
 
     def export_data(self):
         """Экспортирует данные в CSV"""
@@ -335,13 +518,33 @@ class MainWindow(QMainWindow):
             self, "Экспорт данных", "anime_collection.csv", "CSV Files (*.csv)"
         )
 
-        if file_path:
-            if self.db.export_to_csv(file_path):
-                QMessageBox.information(self, "Успех",
-                                        f"✅ Данные успешно экспортированы в:\n{file_path}")
-            else:
-                QMessageBox.critical(self, "Ошибка",
-                                     "❌ Не удалось экспортировать данные")
+        if not file_path:
+            return
+
+        progress_dialog = QProgressDialog("Экспорт данных...", "Отмена", 0, 0, self)
+        progress_dialog.setWindowTitle("Экспорт")
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+
+        def on_progress(exported, total):
+            progress_dialog.setMaximum(total)
+            progress_dialog.setValue(exported)
+            progress_dialog.setLabelText(f"Экспортировано {exported} из {total}")
+            QApplication.processEvents()
+            return not progress_dialog.wasCanceled()
+
+        success = self.db.export_to_csv(file_path, on_progress)
+        canceled = progress_dialog.wasCanceled()
+        progress_dialog.close()
+
+        if success:
+            QMessageBox.information(self, "Успех",
+                                    f"✅ Данные успешно экспортированы в:\n{file_path}")
+        elif canceled:
+            self.statusbar.showMessage("Экспорт отменен", 3000)
+        else:
+            QMessageBox.critical(self, "Ошибка",
+                                 "❌ Не удалось экспортировать данные")
 
     def import_data(self):
         """Импортирует данные из CSV"""
@@ -352,116 +555,54 @@ class MainWindow(QMainWindow):
         if not file_path:
             return
 
+        # Что делать с аниме, которые уже есть в коллекции
+        duplicate_modes = {
+            "Пропустить": 'skip',
+            "Обновить данными из файла": 'update',
+            "Дополнить пустые поля": 'merge',
+            "Добавить как новые записи": 'add',
+        }
+        mode, ok = QInputDialog.getItem(
+            self, "Импорт данных", "Аниме, которые уже есть в коллекции:",
+            list(duplicate_modes), 0, False
+        )
+        if not ok:
+            return
+
+        progress_dialog = QProgressDialog("Импорт данных...", "Отмена", 0, 1000, self)
+        progress_dialog.setWindowTitle("Импорт данных")
+        progress_dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+
+        def on_progress(done_bytes, total_bytes, processed, rate):
+            progress_dialog.setValue(int(done_bytes * 1000 / total_bytes) if total_bytes else 1000)
+            progress_dialog.setLabelText(f"Обработано записей: {processed} ({rate:.0f} в секунду)")
+            QApplication.processEvents()
+            return not progress_dialog.wasCanceled()
+
         try:
-            imported_count = 0
-            skipped_count = 0
-            errors = []
-
-            with open(file_path, 'r', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-
-                if not reader.fieldnames:
-                    QMessageBox.critical(self, "Ошибка", "CSV файл пустой или поврежден")
-                    return
-
-                # Проверяем обязательные поля
-                required_fields = ['title', 'status']
-                missing_fields = [field for field in required_fields if field not in reader.fieldnames]
-
-                if missing_fields:
-                    QMessageBox.critical(self, "Ошибка",
-                                         f"В CSV файле отсутствуют обязательные поля: {', '.join(missing_fields)}")
-                    return
-
-                total_rows = 0
-                rows = []
-                for row in reader:
-                    rows.append(row)
-                    total_rows += 1
-
-                # Показываем прогресс для больших файлов
-                if total_rows > 10:
-                    progress_dialog = QInputDialog(self)
-                    progress_dialog.setWindowTitle("Импорт данных")
-                    progress_dialog.setLabelText(f"Импортируется {total_rows} записей...")
-                    progress_dialog.setCancelButtonText("Отмена")
-                    progress_dialog.show()
-
-                for i, row in enumerate(rows):
-                    try:
-                        # Очищаем и проверяем данные
-                        title = row.get('title', '').strip()
-                        if not title:
-                            errors.append(f"Строка {i + 2}: Отсутствует название")
-                            skipped_count += 1
-                            continue
-
-                        # Проверяем статус
-                        status = row.get('status', 'Запланировано').strip()
-                        valid_statuses = ['Запланировано', 'Смотрю', 'Просмотрено', 'Отложено', 'Брошено']
-                        if status not in valid_statuses:
-                            status = 'Запланировано'  # Значение по умолчанию
-
-                        # Обрабатываем рейтинг
-                        rating_str = row.get('rating', '').strip()
-                        rating = None
-                        if rating_str and rating_str.isdigit():
-                            rating_int = int(rating_str)
-                            if 1 <= rating_int <= 10:
-                                rating = rating_int
-
-                        # Обрабатываем эпизоды
-                        total_episodes_str = row.get('total_episodes', '0').strip()
-                        watched_episodes_str = row.get('watched_episodes', '0').strip()
-
-                        total_episodes = 0
-                        if total_episodes_str.isdigit():
-                            total_episodes = int(total_episodes_str)
-
-                        watched_episodes = 0
-                        if watched_episodes_str.isdigit():
-                            watched_episodes = int(watched_episodes_str)
-
-                        # Проверяем, что watched не больше total
-                        if watched_episodes > total_episodes:
-                            watched_episodes = total_episodes
-
-                        # Обрабатываем даты
-                        start_date = row.get('start_date', '').strip() or None
-                        finish_date = row.get('finish_date', '').strip() or None
-
-                        # Преобразуем данные
-                        anime_data = {
-                            'title': title,
-                            'studio': row.get('studio', '').strip(),
-                            'genre': row.get('genre', '').strip() or None,
-                            'type': row.get('type', 'TV Сериал').strip(),
-                            'status': status,
-                            'start_date': start_date,
-                            'finish_date': finish_date,
-                            'rating': rating,
-                            'total_episodes': total_episodes,
-                            'watched_episodes': watched_episodes,
-                            'review': row.get('review', '').strip(),
-                            'poster_image': None  # Постеры из CSV не импортируем
-                        }
-
-                        # Добавляем в базу
-                        anime_id = self.db.add_anime(anime_data)
-                        if anime_id:
-                            imported_count += 1
-                        else:
-                            errors.append(f"Строка {i + 2}: Не удалось добавить в базу данных")
-                            skipped_count += 1
-
-                    except Exception as e:
-                        errors.append(f"Строка {i + 2}: {str(e)}")
-                        skipped_count += 1
-                        continue
+            importer = CsvImporter(self.db, file_path, on_duplicate=duplicate_modes[mode])
+            # Во время импорта список не перезагружается после каждой порции,
+            # а обслуживание не конкурирует с импортом за запись
+            self.change_timer.stop()
+            self.maintenance_timer.stop()
+            try:
+                importer.run(on_progress)
+            finally:
+                progress_dialog.close()
+                self.change_timer.start()
+                self.maintenance_timer.start()
+
+            imported_count = importer.imported
+            skipped_count = importer.skipped
+            errors = importer.error_lines()
 
             # Показываем результаты импорта
-            result_message = f"✅ Импорт завершен!\n\n"
-            result_message += f"Успешно импортировано: {imported_count}\n"
+            if importer.cancelled:
+                result_message = f"⚠️ Импорт отменен\n\n"
+            else:
+                result_message = f"✅ Импорт завершен!\n\n"
+            result_message += f"Успешно импортировано или обновлено: {imported_count}\n"
             result_message += f"Пропущено: {skipped_count}\n"
 
             if errors:
@@ -485,6 +626,8 @@ class MainWindow(QMainWindow):
         except UnicodeDecodeError:
             QMessageBox.critical(self, "Ошибка",
                                  "Невозможно прочитать файл. Убедитесь, что файл сохранен в кодировке UTF-8.")
+        except ValueError as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
         except Exception as e:
             QMessageBox.critical(self, "Ошибка",
                                  f"Ошибка при импорте данных:\n{str(e)}")
@@ -577,7 +720,7 @@ class MainWindow(QMainWindow):
         if not self.current_anime_id:
             return
 
-        anime = self.db.get_anime(self.current_anime_id)
+        anime = self.db.get_anime_summary(self.current_anime_id)
         if not anime:
             return
 
@@ -591,23 +734,15 @@ class MainWindow(QMainWindow):
 
         if reply == QMessageBox.StandardButton.Yes:
             try:
-                # Обновляем данные
-                update_data = {
-                    'title': anime['title'],
-                    'studio': anime['studio'] or '',
-                    'genre': anime.get('genre_name'),
-                    'type': anime['type'],
-                    'status': 'Просмотрено',
-                    'start_date': anime['start_date'] or QDate.currentDate().toString("yyyy-MM-dd"),
-                    'finish_date': QDate.currentDate().toString("yyyy-MM-dd"),
-                    'rating': anime['rating'],
-                    'review': anime['review'] or '',
-                    'poster_image': anime.get('poster_image'),
-                    'total_episodes': anime.get('total_episodes', 0) or 0,
-                    'watched_episodes': anime.get('total_episodes', 0) or 0
-                }
-
-                self.db.update_anime(self.current_anime_id, update_data)
+                # Обновляем только статус, даты и просмотренные эпизоды
+                today = QDate.currentDate().toString("yyyy-MM-dd")
+                self.db.patch_anime(
+                    self.current_anime_id,
+                    status='Просмотрено',
+                    start_date=anime['start_date'] or today,
+                    finish_date=today,
+                    watched_episodes=anime.get('total_episodes', 0) or 0
+                )
                 self.load_anime()
                 self.statusbar.showMessage(f"✅ '{anime['title']}' отмечено как просмотренное", 3000)
 
@@ -666,6 +801,16 @@ class MainWindow(QMainWindow):
         )
 
         if reply == QMessageBox.StandardButton.Yes:
+            # Таймеры больше не должны обращаться к базе и ставить запросы в остановленный поток
+            self.change_timer.stop()
+            self.maintenance_timer.stop()
+            self.db_async.stop()
+            # Перед закрытием SQLite рекомендует PRAGMA optimize
+            try:
+                self.maintenance.optimize()
+            except sqlite3.Error as e:
+                print(f"Error optimizing database: {e}")
+            self.db.close()
             event.accept()
         else:
             event.ignore()
\ No newline at end of file
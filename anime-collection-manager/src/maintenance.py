@@ -0,0 +1,171 @@
+import os
+import sqlite3
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+# PRAGMA auto_vacuum: 0 - выключен, 1 - полный, 2 - инкрементальный
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Сколько свободных страниц возвращается файловой системе за один шаг в простое
+VACUUM_STEP_PAGES = 256
+
+# Как часто обновлять статистику планировщика (PRAGMA optimize), секунды
+OPTIMIZE_INTERVAL = 60 * 60
+
+# Сколько строк каждого индекса просматривает ANALYZE (0 - без ограничения)
+ANALYSIS_LIMIT = 1000
+
+
+class DatabaseMaintenance:
+    """Обслуживание файла базы: инкрементальная очистка, статистика планировщика, отчет о размере.
+
+    Удаленные данные (например, постеры) освобождают страницы внутри файла; при
+    auto_vacuum = INCREMENTAL их можно возвращать файловой системе небольшими
+    порциями (run_step), не блокируя базу полным VACUUM. Существующая база
+    переводится в этот режим только по запросу (compact), не при запуске.
+    Методы выполняются в потоке вызывающего кода на его соединении с базой.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._optimized_at = None
+
+    def _pragma(self, name: str) -> int:
+        return self.db.connect().execute(f"PRAGMA {name}").fetchone()[0]
+
+    def incremental_enabled(self) -> bool:
+        """Включена ли инкрементальная очистка (auto_vacuum = INCREMENTAL)"""
+        return self._pragma('auto_vacuum') == AUTO_VACUUM_INCREMENTAL
+
+    def enable_incremental_vacuum(self):
+        """Переводит базу на инкрементальную очистку.
+
+        Для базы с таблицами режим меняется только вместе с полным VACUUM,
+        поэтому вызов может быть долгим; выполняется один раз для базы.
+        """
+        if self.incremental_enabled():
+            return
+        conn = self.db.connect()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+    def incremental_vacuum(self, pages: int = VACUUM_STEP_PAGES) -> int:
+        """Возвращает файловой системе до pages свободных страниц (0 - все); возвращает их число"""
+        if not self.incremental_enabled():
+            return 0
+        before = self._pragma('freelist_count')
+        if not before:
+            return 0
+        # PRAGMA освобождает по странице за шаг выполнения, а execute() делает только
+        # первый шаг; executescript() выполняет инструкцию до конца
+        self.db.connect().executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+        return before - self._pragma('freelist_count')
+
+    def compact(self) -> int:
+        """Сжимает базу целиком и обновляет статистику планировщика; возвращает число освобожденных страниц.
+
+        Базу без инкрементальной очистки переводит на нее полным VACUUM (долго,
+        нужно свободное место на диске примерно в размер базы), иначе освобождает
+        все свободные страницы.
+        """
+        before = self._pragma('page_count')
+        if self.incremental_enabled():
+            self.incremental_vacuum(0)
+        else:
+            self.enable_incremental_vacuum()
+        self.optimize()
+        return before - self._pragma('page_count')
+
+    def optimize(self):
+        """Обновляет статистику планировщика запросов (ANALYZE при первом запуске, дальше PRAGMA optimize)"""
+        conn = self.db.connect()
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        has_stats = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+        ).fetchone()
+        conn.execute("PRAGMA optimize" if has_stats else "ANALYZE")
+        self._optimized_at = time.monotonic()
+
+    def run_step(self) -> int:
+        """Одна порция обслуживания в простое: немного свободных страниц и, если пора, optimize.
+
+        Возвращает количество освобожденных страниц.
+        """
+        freed = self.incremental_vacuum()
+        if self._optimized_at is None or time.monotonic() - self._optimized_at >= OPTIMIZE_INTERVAL:
+            self.optimize()
+        return freed
+
+    def object_sizes(self) -> Optional[List[Tuple[str, str, int]]]:
+        """Размеры таблиц и индексов по dbstat: [(имя, тип, байт), ...] по убыванию размера.
+
+        Возвращает None, если SQLite собран без виртуальной таблицы dbstat.
+        """
+        try:
+            cursor = self.db.connect().execute('''
+                SELECT s.name, COALESCE(m.type, 'table'), SUM(s.pgsize) AS size
+                FROM dbstat s
+                LEFT JOIN sqlite_master m ON m.name = s.name
+                GROUP BY s.name
+                ORDER BY size DESC
+            ''')
+        except sqlite3.OperationalError:
+            return None
+        return [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+
+    def size_report(self) -> Dict[str, Any]:
+        """Размер файла базы, свободные страницы, объем постеров и размеры объектов"""
+        page_size = self._pragma('page_size')
+        page_count = self._pragma('page_count')
+        freelist_count = self._pragma('freelist_count')
+        posters, poster_bytes = self.db.connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM posters"
+        ).fetchone()
+
+        wal_path = f"{self.db.db_path}-wal"
+        return {
+            'page_size': page_size,
+            'page_count': page_count,
+            'freelist_count': freelist_count,
+            'db_bytes': page_size * page_count,
+            'free_bytes': page_size * freelist_count,
+            'wal_bytes': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+            'auto_vacuum': self._pragma('auto_vacuum'),
+            'posters': posters,
+            'poster_bytes': poster_bytes,
+            'objects': self.object_sizes(),
+        }
+
+    def report_text(self) -> str:
+        """Отчет о размере базы в виде текста"""
+        report = self.size_report()
+        modes = {0: "выключена", 1: "полная", 2: "инкрементальная"}
+        lines = [
+            f"Размер базы: {format_size(report['db_bytes'])} "
+            f"({report['page_count']} страниц по {report['page_size']} байт)",
+            f"Свободно внутри файла: {format_size(report['free_bytes'])} ({report['freelist_count']} страниц)",
+            f"Журнал WAL: {format_size(report['wal_bytes'])}",
+            f"Автоочистка: {modes.get(report['auto_vacuum'], report['auto_vacuum'])}"
+            + ("" if report['auto_vacuum'] == AUTO_VACUUM_INCREMENTAL else " (включится при сжатии базы)"),
+            f"Постеры: {report['posters']}, {format_size(report['poster_bytes'])}",
+        ]
+
+        objects = report['objects']
+        if objects is None:
+            lines.append("Размеры таблиц и индексов недоступны (SQLite без dbstat)")
+        else:
+            lines.append("")
+            lines.append("Таблицы и индексы:")
+            for name, object_type, size in objects:
+                kind = "индекс" if object_type == 'index' else "таблица"
+                lines.append(f"  {name} ({kind}): {format_size(size)}")
+        return "\n".join(lines)
+
+
+def format_size(size: int) -> str:
+    """Размер в байтах в читаемом виде"""
+    for unit in ("байт", "КБ", "МБ"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "байт" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
@@ -0,0 +1,272 @@
+import sqlite3
+import time
+import threading
+import logging
+import functools
+import hashlib
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+
+
+class QueryStats:
+    """Счетчики вызовов методов Database и SQL-запросов: количество, время, строки, байты"""
+
+    def __init__(self, slow_query_ms: float = 100.0, slow_log_path: Optional[str] = None,
+                 max_samples: int = 1000):
+        self.slow_query_ms = slow_query_ms
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._counters = {}
+
+        # Один логгер на процесс; файл лога - у каждого экземпляра свой (если указан путь),
+        # поэтому обработчик не добавляется к логгеру, а вызывается напрямую и закрывается в close()
+        self.slow_log = logging.getLogger("anime_manager.slow_queries")
+        self.slow_log.propagate = False
+        self.slow_log.setLevel(logging.WARNING)
+        if not self.slow_log.handlers:
+            # Без обработчика logging выводил бы предупреждения в stderr
+            self.slow_log.addHandler(logging.NullHandler())
+
+        self.slow_log_handler = None
+        if slow_log_path:
+            self.slow_log_handler = logging.FileHandler(slow_log_path, encoding='utf-8', delay=True)
+            self.slow_log_handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+
+    def record(self, kind: str, name: str, duration: float, rows: int = 0, size: int = 0):
+        """Учитывает один вызов (kind - 'method' или 'sql', duration - в секундах)"""
+        key = (kind, name)
+        with self._lock:
+            counter = self._counters.get(key)
+            if counter is None:
+                counter = {
+                    'calls': 0, 'total': 0.0, 'rows': 0, 'bytes': 0,
+                    'samples': deque(maxlen=self.max_samples)
+                }
+                self._counters[key] = counter
+            counter['calls'] += 1
+            counter['total'] += duration
+            counter['rows'] += rows
+            counter['bytes'] += size
+            counter['samples'].append(duration)
+
+        duration_ms = duration * 1000
+        if duration_ms >= self.slow_query_ms:
+            record = self.slow_log.makeRecord(
+                self.slow_log.name, logging.WARNING, __file__, 0,
+                "%s %.1f ms rows=%d bytes=%d %s", (kind, duration_ms, rows, size, name), None
+            )
+            self.slow_log.handle(record)
+            if self.slow_log_handler is not None:
+                self.slow_log_handler.handle(record)
+
+    def close(self):
+        """Закрывает файл лога медленных запросов"""
+        handler, self.slow_log_handler = self.slow_log_handler, None
+        if handler is not None:
+            handler.close()
+
+    def snapshot(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """Возвращает текущие счетчики с p50/p99 в миллисекундах"""
+        with self._lock:
+            counters = {key: dict(counter, samples=sorted(counter['samples']))
+                        for key, counter in self._counters.items()}
+
+        result = {}
+        for key, counter in counters.items():
+            samples = counter['samples']
+            result[key] = {
+                'calls': counter['calls'],
+                'total_ms': counter['total'] * 1000,
+                'p50_ms': self._percentile(samples, 0.50) * 1000,
+                'p99_ms': self._percentile(samples, 0.99) * 1000,
+                'rows': counter['rows'],
+                'bytes': counter['bytes'],
+            }
+        return result
+
+    def report(self) -> str:
+        """Форматирует счетчики в текстовую таблицу (самые затратные сверху)"""
+        lines = [f"{'calls':>7} {'total ms':>10} {'p50 ms':>8} {'p99 ms':>8} {'rows':>9} {'bytes':>12}  name"]
+        for kind in ('method', 'sql'):
+            items = [(name, stats) for (item_kind, name), stats in self.snapshot().items() if item_kind == kind]
+            if not items:
+                continue
+            lines.append(f"--- {kind} ---")
+            for name, stats in sorted(items, key=lambda item: item[1]['total_ms'], reverse=True):
+                lines.append(
+                    f"{stats['calls']:>7} {stats['total_ms']:>10.1f} {stats['p50_ms']:>8.2f} "
+                    f"{stats['p99_ms']:>8.2f} {stats['rows']:>9} {stats['bytes']:>12}  {name}"
+                )
+        return "\n".join(lines)
+
+    def reset(self):
+        """Сбрасывает все счетчики"""
+        with self._lock:
+            self._counters.clear()
+
+    @staticmethod
+    def _percentile(samples, fraction: float) -> float:
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def measure_result(result) -> Tuple[int, int]:
+    """Оценивает количество строк и байт в результате метода Database"""
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        result = result[0]  # (страница, курсор)
+    if isinstance(result, dict):
+        rows = [result]
+    elif isinstance(result, list):
+        rows = result
+    else:
+        return 0, 0
+
+    size = 0
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        for value in row.values():
+            if isinstance(value, (bytes, bytearray, memoryview)):
+                size += len(value)
+            elif isinstance(value, str):
+                size += len(value)
+    return len(rows), size
+
+
+def instrumented(method):
+    """Декоратор метода Database: время вызова, строки и байты результата"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+        rows, size = measure_result(result)
+        self.query_stats.record('method', method.__name__, duration, rows, size)
+        return result
+    return wrapper
+
+
+def _sql_name(sql: str) -> str:
+    """Нормализует текст запроса для использования в качестве ключа счетчика"""
+    sql = " ".join(sql.split())
+    if len(sql) <= 160:
+        return sql
+    # Длинные запросы часто начинаются одинаково (общий список колонок) - различаем их по хешу
+    return f"{sql[:140]}... #{hashlib.md5(sql.encode('utf-8')).hexdigest()[:8]}"
+
+
+def _row_size(row) -> int:
+    """Объем строк и BLOB в строке результата, байт"""
+    size = 0
+    for value in row:
+        if isinstance(value, (bytes, bytearray, memoryview, str)):
+            size += len(value)
+    return size
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, который измеряет каждый запрос: время выполнения и выборки, строки и байты результата.
+
+    SELECT учитывается, когда результат прочитан до конца, курсор выполняет
+    следующий запрос или закрывается: время fetch* входит во время запроса.
+    """
+
+    _pending = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            result = super().execute(sql, parameters)
+        except Exception:
+            self._pending = [sql, time.perf_counter() - start, 0, 0]
+            self._finish()
+            raise
+        self._pending = [sql, time.perf_counter() - start, 0, 0]
+        if self.description is None:
+            # Запрос без результата (INSERT, UPDATE, ...) - учитываем измененные строки
+            self._pending[2] = max(self.rowcount, 0)
+            self._finish()
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._pending = [sql, time.perf_counter() - start, max(self.rowcount, 0), 0]
+            self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched([] if row is None else [row], time.perf_counter() - start, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(rows, time.perf_counter() - start, len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(rows, time.perf_counter() - start, True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched([], time.perf_counter() - start, True)
+            raise
+        self._fetched([row], time.perf_counter() - start, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _fetched(self, rows, duration, finished):
+        pending = self._pending
+        if pending is not None:
+            pending[1] += duration
+            pending[2] += len(rows)
+            pending[3] += sum(_row_size(row) for row in rows)
+            if finished:
+                self._finish()
+
+    def _finish(self):
+        """Записывает счетчики текущего запроса"""
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        stats = getattr(self.connection, 'query_stats', None)
+        if stats is not None:
+            sql, duration, rows, size = pending
+            stats.record('sql', _sql_name(sql), duration, rows, size)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение, все запросы которого проходят через InstrumentedCursor"""
+
+    query_stats = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
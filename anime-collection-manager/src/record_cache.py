@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+
+class RecordCache:
+    """LRU-кэш записей по ID с ограничением по объему (постеры учитываются в байтах)"""
+
+    # Примерная стоимость записи в памяти без учета строк и BLOB
+    ENTRY_OVERHEAD = 512
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Растет при каждой инвалидации: результат чтения, начатого до записи, в кэш не попадет
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key) -> Optional[Dict[str, Any]]:
+        """Возвращает копию записи из кэша или None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, key, record: Dict[str, Any], generation: int):
+        """Кладет запись в кэш, если с момента ее чтения (generation) не было инвалидаций"""
+        size = self.sizeof(record)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._remove(key)
+            self._entries[key] = (dict(record), size)
+            self._bytes += size
+            # Вытесняем самые давно использованные записи
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def invalidate(self, key):
+        """Удаляет запись из кэша - вызывается после изменения записи в базе"""
+        with self._lock:
+            self._generation += 1
+            self._remove(key)
+
+    def clear(self):
+        """Очищает кэш целиком"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики попаданий и промахов, количество и объем записей"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    @classmethod
+    def sizeof(cls, record: Dict[str, Any]) -> int:
+        """Оценивает объем записи: BLOB и строки по длине, остальное - фиксированная надбавка"""
+        size = cls.ENTRY_OVERHEAD
+        for value in record.values():
+            if isinstance(value, (bytes, bytearray, memoryview, str)):
+                size += len(value)
+        return size
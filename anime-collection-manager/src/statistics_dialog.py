@@ -9,9 +9,12 @@ from datetime import datetime
 
 
 class StatisticsDialog(QDialog):
-    def __init__(self, db, parent=None):
+    def __init__(self, db, parent=None, db_async=None, snapshot=None):
         super().__init__(parent)
         self.db = db
+        self.db_async = db_async
+        # Колоночный снимок коллекции для вкладки аналитики (analytics.CollectionSnapshot)
+        self.snapshot = snapshot
 
         # Загружаем интерфейс
         ui_path = os.path.join(os.path.dirname(__file__), '..', 'qt', 'statistics_dialog.ui')
@@ -19,6 +22,7 @@ class StatisticsDialog(QDialog):
 
         self.setup_ui()
         self.load_statistics()
+        self.load_analytics()
 
     def setup_ui(self):
         """Настраивает интерфейс"""
@@ -35,11 +39,59 @@ class StatisticsDialog(QDialog):
         self.table_types.setColumnCount(2)
         self.table_types.setHorizontalHeaderLabels(["Тип", "Количество"])
 
+        self.table_genre_ratings.setColumnCount(5)
+        self.table_genre_ratings.setHorizontalHeaderLabels(["Жанр", "Оценок", "P25", "Медиана", "P75"])
+
     def load_statistics(self):
-        """Загружает статистику"""
+        """Загружает статистику (в фоновом потоке, если он передан)"""
+        # Данные не менялись с прошлого подсчета (в том числе до перезапуска) - показываем сохраненную
+        try:
+            stats = self.db.cached_statistics()
+        except Exception as e:
+            print(f"Ошибка при чтении кэша статистики: {e}")
+            stats = None
+        if stats is not None:
+            self.show_statistics(stats)
+            return
+
+        if self.db_async:
+            self.db_async.submit('statistics', 'get_statistics_cached',
+                                 callback=self.show_statistics, errback=self.show_error)
+            return
+
+        try:
+            stats = self.db.get_statistics_cached()
+        except Exception as e:
+            self.show_error(e)
+            return
+        self.show_statistics(stats)
+
+    def load_analytics(self):
+        """Загружает аналитику по снимку коллекции (в фоновом потоке, если он передан)"""
+        if self.snapshot is None:
+            self.lbl_completion.setText("Аналитика недоступна")
+            return
+
+        if self.db_async:
+            self.db_async.submit('analytics', self.snapshot.analytics,
+                                 callback=self.show_analytics, errback=self.show_error)
+            return
+
         try:
-            stats = self.db.get_statistics()
+            analytics = self.snapshot.analytics()
+        except Exception as e:
+            self.show_error(e)
+            return
+        self.show_analytics(analytics)
+
+    def show_error(self, error):
+        """Сообщает об ошибке загрузки статистики"""
+        print(f"Ошибка при загрузке статистики: {error}")
+        QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить статистику:\n{str(error)}")
 
+    def show_statistics(self, stats):
+        """Заполняет диалог загруженной статистикой"""
+        try:
             # Общая статистика
             self.lbl_total_anime.setText(str(stats.get('total', 0)))
             self.lbl_watched_anime.setText(str(stats.get('watched_count', 0)))
@@ -93,8 +145,7 @@ class StatisticsDialog(QDialog):
             self.load_types_stats(stats.get('types_stats', []))
 
         except Exception as e:
-            print(f"Ошибка при загрузке статистики: {e}")
-            QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить статистику:\n{str(e)}")
+            self.show_error(e)
 
     def create_monthly_chart(self, monthly_stats):
         """Создает график просмотра по месяцам"""
@@ -358,4 +409,93 @@ class StatisticsDialog(QDialog):
         fig.tight_layout()
 
         layout = QVBoxLayout(self.widget_types_chart)
-        layout.addWidget(canvas)
\ No newline at end of file
+        layout.addWidget(canvas)
+
+    def show_analytics(self, analytics):
+        """Заполняет вкладку аналитики"""
+        try:
+            self.load_genre_ratings(analytics.get('rating_percentiles', []))
+            self.load_completion(analytics.get('completion', {}))
+            self.create_watch_time_chart(analytics.get('watch_time', []))
+            self.load_year_genre(analytics.get('year_genre', {}))
+        except Exception as e:
+            print(f"Ошибка при отображении аналитики: {e}")
+
+    def load_genre_ratings(self, genre_ratings):
+        """Загружает перцентили оценок по жанрам"""
+        self.table_genre_ratings.setRowCount(len(genre_ratings))
+
+        for row, item in enumerate(genre_ratings):
+            self.table_genre_ratings.setItem(row, 0, QTableWidgetItem(item.get('genre', '')))
+            self.table_genre_ratings.setItem(row, 1, QTableWidgetItem(str(item.get('count', 0))))
+            for column, value in enumerate(item.get('percentiles', []), start=2):
+                self.table_genre_ratings.setItem(row, column, QTableWidgetItem(f"{value:g}"))
+
+    def load_completion(self, completion):
+        """Показывает долю просмотренных эпизодов"""
+        lines = [
+            f"Просмотрено эпизодов: {completion.get('overall', 0) * 100:.1f}%",
+            f"В среднем по аниме: {completion.get('mean', 0) * 100:.1f}%",
+            f"Досмотрено до конца: {completion.get('finished_share', 0) * 100:.1f}%",
+        ]
+        by_status = completion.get('by_status', {})
+        if by_status:
+            lines.append("")
+            lines.append("По статусам:")
+            for status, ratio in by_status.items():
+                lines.append(f"  {status}: {ratio * 100:.1f}%")
+        self.lbl_completion.setText("\n".join(lines))
+
+    def create_watch_time_chart(self, watch_time):
+        """Создает гистограмму времени просмотра одного аниме"""
+        for i in reversed(range(self.widget_watch_time_chart.layout().count() if self.widget_watch_time_chart.layout() else 0)):
+            widget = self.widget_watch_time_chart.layout().itemAt(i).widget()
+            if widget:
+                widget.setParent(None)
+
+        if not watch_time:
+            layout = QVBoxLayout(self.widget_watch_time_chart)
+            label = QLabel("Нет данных для графика")
+            label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            layout.addWidget(label)
+            return
+
+        starts = [item['from'] for item in watch_time]
+        widths = [item['to'] - item['from'] for item in watch_time]
+        counts = [item['count'] for item in watch_time]
+
+        fig = Figure(figsize=(5.5, 4))
+        canvas = FigureCanvas(fig)
+
+        ax = fig.add_subplot(111)
+        ax.bar(starts, counts, width=widths, align='edge', color='#70a1ff', edgecolor='#2f3542', linewidth=1.2)
+
+        ax.set_xlabel('Часов на аниме', fontsize=10, fontweight='bold')
+        ax.set_ylabel('Количество аниме', fontsize=10, fontweight='bold')
+        ax.set_title('Время просмотра', fontsize=11, fontweight='bold', color='#2f3542')
+        ax.set_facecolor('#f1f2f6')
+        fig.patch.set_facecolor('#f1f2f6')
+
+        # Добавляем сетку
+        ax.grid(True, alpha=0.3, linestyle='--', axis='y')
+
+        fig.tight_layout()
+
+        layout = QVBoxLayout(self.widget_watch_time_chart)
+        layout.addWidget(canvas)
+
+    def load_year_genre(self, year_genre):
+        """Загружает таблицу количества аниме по году окончания и жанру"""
+        years = year_genre.get('years', [])
+        genres = year_genre.get('genres', [])
+        counts = year_genre.get('counts', [])
+
+        self.table_year_genre.setColumnCount(len(genres))
+        self.table_year_genre.setHorizontalHeaderLabels(genres)
+        self.table_year_genre.setRowCount(len(years))
+        self.table_year_genre.setVerticalHeaderLabels([str(year) for year in years])
+
+        for row, year_counts in enumerate(counts):
+            for column, count in enumerate(year_counts):
+                if count:
+                    self.table_year_genre.setItem(row, column, QTableWidgetItem(str(count)))